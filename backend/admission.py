@@ -0,0 +1,77 @@
+# admission.py - Bounded LLM concurrency with a bounded, time-limited wait queue
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict
+
+class Overloaded(Exception):
+    """Raised when a request cannot be admitted; the caller should answer 503 with Retry-After"""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+class AdmissionController:
+    """At most max_concurrent LLM calls run at once; up to max_queue more wait max_wait seconds"""
+
+    def __init__(self, max_concurrent: int, max_queue: int, max_wait: float,
+                 degrade_queue_depth: int, retry_after: int):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.degrade_queue_depth = degrade_queue_depth
+        self.retry_after = retry_after
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected_queue_full = 0
+        self.rejected_timeout = 0
+
+    @property
+    def degraded(self) -> bool:
+        """True once a queue forms; callers then trim prompts so slots free up sooner"""
+        return self.waiting >= self.degrade_queue_depth
+
+    def check(self):
+        """Fail fast, without queueing, if a new request would be rejected right now"""
+        if self.active >= self.max_concurrent and self.waiting >= self.max_queue:
+            self.rejected_queue_full += 1
+            raise Overloaded("LLM queue is full", self.retry_after)
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        """Hold one LLM slot for the duration of the block"""
+        if self._semaphore.locked():
+            self.check()
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), self.max_wait)
+            except asyncio.TimeoutError:
+                self.rejected_timeout += 1
+                raise Overloaded("Timed out waiting for an LLM slot", self.retry_after)
+            finally:
+                self.waiting -= 1
+        else:
+            await self._semaphore.acquire()
+
+        self.active += 1
+        self.admitted += 1
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self._semaphore.release()
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters for the stats endpoint"""
+        return {
+            "active": self.active,
+            "queue_depth": self.waiting,
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "degraded": self.degraded,
+            "admitted": self.admitted,
+            "rejected_queue_full": self.rejected_queue_full,
+            "rejected_timeout": self.rejected_timeout
+        }
@@ -1,10 +1,17 @@
 # app.py - Main FastAPI application
+import asyncio
+import json
 import logging
+import time
+from contextlib import aclosing
+from typing import Dict, Any
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 
-from models import ChatMessage, ChatResponse, Config
+from models import ChatMessage, ChatResponse, SearchBatchRequest, Config
 from rag_service import RAGService
+from admission import Overloaded
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -25,6 +32,14 @@ app.add_middleware(
 # Initialize RAG service
 rag_service = RAGService()
 
+# End-to-end latency of the chat endpoints
+chat_latency = rag_service.metrics.histogram(
+    "chat_request_seconds", "End-to-end chat latency (full stream for /chat/stream)", labels={"endpoint": "/chat"}
+)
+chat_stream_latency = rag_service.metrics.histogram(
+    "chat_request_seconds", "End-to-end chat latency (full stream for /chat/stream)", labels={"endpoint": "/chat/stream"}
+)
+
 @app.on_event("startup")
 async def startup_event():
     """Initialize models and data on startup"""
@@ -35,38 +50,88 @@ async def startup_event():
         logger.error("TOGETHER_API_KEY not found in environment variables")
         raise RuntimeError("TOGETHER_API_KEY is required")
     
-    # Initialize all RAG components
-    rag_service.initialize_all()
+    # Expire idle sessions periodically
+    rag_service.conversations.start_sweeper(Config.SESSION_SWEEP_INTERVAL)
+    
+    # Check the LLM provider in the background; /health only reads the last result
+    rag_service.llm_prober.start()
+    
+    # Summarize long conversations in the background, after their responses are sent
+    if rag_service.summarizer is not None:
+        rag_service.summarizer.start()
     
-    logger.info("RAG backend with memory startup completed successfully")
+    # Load or build the index in the background; /readyz reports when retrieval is available.
+    # Workers forked by serve.py inherit an index the parent already loaded.
+    if rag_service.ready.is_set():
+        logger.info("RAG backend with memory startup completed successfully")
+    else:
+        rag_service.initialize_in_background()
+        logger.info("RAG backend with memory accepting requests, index loading in background")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Close pooled LLM connections on shutdown"""
+    await rag_service.aclose()
+
+async def wait_until_ready():
+    """Hold a request while the index loads, then fail fast with 503 if it is still unavailable"""
+    deadline = time.monotonic() + Config.READINESS_WAIT_TIMEOUT
+    while not rag_service.ready.is_set():
+        if rag_service.status == "failed" or time.monotonic() >= deadline:
+            raise HTTPException(
+                status_code=503,
+                detail="Service is starting up, please retry shortly",
+                headers={"Retry-After": str(Config.READINESS_RETRY_AFTER)}
+            )
+        await asyncio.sleep(0.05)
+
+def overloaded_error(error: Overloaded) -> HTTPException:
+    """503 telling the client when to retry, returned instead of queueing without bound"""
+    return HTTPException(
+        status_code=503,
+        detail=f"Service is busy: {error.reason}",
+        headers={"Retry-After": str(error.retry_after)}
+    )
 
 @app.get("/")
 async def root():
     """Health check endpoint"""
     return {"message": "Taofik Portfolio RAG API with Memory is running!"}
 
+@app.get("/livez")
+async def liveness_check():
+    """Liveness: the event loop is serving requests (no I/O)"""
+    return {"status": "alive"}
+
+@app.get("/readyz")
+async def readiness_check():
+    """Readiness: 200 once retrieval is available, 503 while loading or after a failed startup"""
+    body = {
+        "status": rag_service.status,
+        "startup_timings": rag_service.startup_timings
+    }
+    if rag_service.startup_error:
+        body["error"] = rag_service.startup_error
+    return JSONResponse(status_code=200 if rag_service.ready.is_set() else 503, content=body)
+
 @app.get("/health")
 async def health_check():
-    """Detailed health check"""
+    """Dependency health check: index state plus the background LLM probe's last result"""
     try:
         # Get stats from RAG service
         stats = rag_service.get_stats()
         
-        # Test Together AI connection
-        import together
-        test_response = together.Complete.create(
-            prompt="Hello",
-            model=Config.LLM_MODEL,
-            max_tokens=5
-        )
-        
-        together_status = "connected" if test_response else "error"
+        # Read the prober's latest result instead of calling the provider per request
+        together_status = rag_service.llm_prober.status
+        healthy = rag_service.ready.is_set() and together_status != "error"
         
         return {
-            "status": "healthy",
+            "status": "healthy" if healthy else "degraded",
+            "index": rag_service.status,
             "chromadb_documents": stats["chromadb_documents"],
             "together_ai": together_status,
-            "embedding_model": "loaded",
+            "llm_probe": rag_service.llm_prober.snapshot(),
+            "embedding_model": "loaded" if rag_service.vectorizer is not None else "not_loaded",
             "active_conversations": stats["active_sessions"]
         }
     except Exception as e:
@@ -75,6 +140,7 @@ async def health_check():
 @app.post("/chat", response_model=ChatResponse)
 async def chat_endpoint(message: ChatMessage):
     """Main chat endpoint with memory"""
+    start_time = time.perf_counter()
     try:
         user_query = message.message.strip()
         session_id = message.session_id
@@ -82,21 +148,64 @@ async def chat_endpoint(message: ChatMessage):
         if not user_query:
             raise HTTPException(status_code=400, detail="Message cannot be empty")
         
-        # Process message through RAG service
-        response = rag_service.process_chat_message(user_query, session_id)
+        await wait_until_ready()
+        
+        # Process message through RAG service without blocking the event loop
+        response = await rag_service.process_chat_message_async(user_query, session_id)
         
         return ChatResponse(response=response, session_id=session_id)
         
     except HTTPException:
         raise
+    except Overloaded as e:
+        raise overloaded_error(e)
     except Exception as e:
         logger.error(f"Error in chat endpoint: {e}")
         raise HTTPException(status_code=500, detail="Internal server error")
+    finally:
+        chat_latency.observe(time.perf_counter() - start_time)
+
+def format_sse(event: str, data: Dict[str, Any]) -> str:
+    """Encode one Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.post("/chat/stream")
+async def chat_stream_endpoint(message: ChatMessage):
+    """Chat endpoint that streams tokens as Server-Sent Events"""
+    user_query = message.message.strip()
+    session_id = message.session_id
+    
+    if not user_query:
+        raise HTTPException(status_code=400, detail="Message cannot be empty")
+    
+    await wait_until_ready()
+    
+    # Reject before the 200 status line is sent while the LLM queue is full
+    try:
+        rag_service.admission.check()
+    except Overloaded as e:
+        raise overloaded_error(e)
+    
+    async def event_stream():
+        start_time = time.perf_counter()
+        try:
+            # aclosing() makes sure the conversation is stored even if the client disconnects
+            async with aclosing(rag_service.stream_chat_message(user_query, session_id)) as events:
+                async for event in events:
+                    yield format_sse(event["event"], event["data"])
+        finally:
+            chat_stream_latency.observe(time.perf_counter() - start_time)
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 @app.delete("/chat/{session_id}")
 async def clear_conversation(session_id: str):
     """Clear conversation history for a session"""
-    success = rag_service.clear_conversation(session_id)
+    success = await asyncio.to_thread(rag_service.clear_conversation, session_id)
     if success:
         return {"message": f"Conversation {session_id} cleared"}
     else:
@@ -105,7 +214,7 @@ async def clear_conversation(session_id: str):
 @app.get("/chat/{session_id}/history")
 async def get_conversation_history(session_id: str):
     """Get conversation history for a session"""
-    history = rag_service.get_conversation_history(session_id)
+    history = await asyncio.to_thread(rag_service.get_conversation_history, session_id)
     return {
         "session_id": session_id, 
         "history": history,
@@ -117,16 +226,50 @@ async def get_stats():
     """Get API statistics"""
     return rag_service.get_stats()
 
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics for this worker process"""
+    return PlainTextResponse(rag_service.metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.post("/search/batch")
+async def search_portfolio_batch(request: SearchBatchRequest):
+    """Search portfolio data for many queries in one pass"""
+    if len(request.queries) > Config.MAX_BATCH_QUERIES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {Config.MAX_BATCH_QUERIES} queries per batch"
+        )
+    
+    await wait_until_ready()
+    
+    try:
+        # Scoring is CPU-bound: keep it off the event loop
+        batch_results = await asyncio.to_thread(
+            rag_service.query_documents_batch, request.queries, n_results=request.n_results
+        )
+        return {
+            "results": [
+                {"query": query, "results": results}
+                for query, results in zip(request.queries, batch_results)
+            ]
+        }
+    except Exception as e:
+        logger.error(f"Error in batch search endpoint: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
 @app.get("/search/{query}")
 async def search_portfolio(query: str):
     """Search portfolio data endpoint"""
+    await wait_until_ready()
+    
     try:
-        results = rag_service.query_chromadb(query, n_results=5)
+        results = await asyncio.to_thread(rag_service.query_chromadb, query, n_results=5)
         return {"query": query, "results": results}
     except Exception as e:
         logger.error(f"Error in search endpoint: {e}")
         raise HTTPException(status_code=500, detail="Internal server error")
 
 if __name__ == "__main__":
+    # Development server; run serve.py for the multi-process production server
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
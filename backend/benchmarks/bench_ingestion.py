@@ -0,0 +1,278 @@
+# bench_ingestion.py - Ingestion and retrieval hot paths on synthetic scaled corpora
+"""Benchmark the RAGService hot paths on synthetic ##-sectioned corpora built from
+akandi_data.txt at several scales. Ingestion is timed through load_portfolio_data on a
+corpus file, exactly as at startup: a full build, an incremental rebuild after one new
+section, and a restart that loads the saved index; then query_documents and
+save_vectors/load_vectors. Reports throughput, p50/p99 latency and peak traced memory
+per stage (parent process only: hashing workers are not traced), and writes everything
+to JSON for later comparison.
+
+Usage (from backend/):
+    python benchmarks/bench_ingestion.py --scales 10 100 1000
+    python benchmarks/bench_ingestion.py --scales 10 --compare benchmarks/results/old.json
+    python benchmarks/bench_ingestion.py --scales 100 --vectorizer hashing --workers 4
+"""
+import argparse
+import gc
+import json
+import logging
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+from models import Config
+from rag_service import RAGService
+
+RESULTS_DIR = os.path.join(BACKEND_DIR, "benchmarks", "results")
+MB = 1024 * 1024
+
+def synthetic_corpus(base_text: str, scale: int, rng: np.random.Generator) -> str:
+    """A ##-sectioned document about scale times the size of base_text, in the same style
+
+    Words are drawn from the base document's vocabulary with a Zipfian distribution, so
+    the TF-IDF vocabulary and document frequencies behave like the real data.
+    """
+    words, counts = np.unique(base_text.split(), return_counts=True)
+    order = np.argsort(-counts)
+    words = words[order]
+    ranks = np.arange(1, len(words) + 1)
+    probs = (1.0 / ranks) / np.sum(1.0 / ranks)
+
+    target = len(base_text) * scale
+    parts: List[str] = ["# SYNTHETIC KNOWLEDGE BASE\n"]
+    size = len(parts[0])
+    section = 0
+    while size < target:
+        section += 1
+        lines = [f"## SECTION {section}: {' '.join(rng.choice(words[:200], size=3)).upper()}", ""]
+        for _ in range(int(rng.integers(8, 30))):
+            sentence = " ".join(rng.choice(words, size=int(rng.integers(8, 30)), p=probs))
+            prefix = "- " if rng.random() < 0.4 else ""
+            lines.append(f"{prefix}{sentence}.")
+        lines.append("")
+        text = "\n".join(lines) + "\n"
+        parts.append(text)
+        size += len(text)
+    return "".join(parts)
+
+def synthetic_queries(corpus: str, n_queries: int, rng: np.random.Generator) -> List[str]:
+    """Short 2-4 word queries sampled from the corpus"""
+    words = corpus.split()
+    return [" ".join(rng.choice(words, size=int(rng.integers(2, 5)))) for _ in range(n_queries)]
+
+def latency_summary(times: List[float], units: float, unit_name: str) -> Dict[str, Any]:
+    """p50/p99/mean of per-call seconds, and units processed per second across all calls"""
+    arr = np.asarray(times)
+    p50 = float(np.percentile(arr, 50))
+    return {
+        "calls": len(times),
+        "p50_ms": round(p50 * 1000, 4),
+        "p99_ms": round(float(np.percentile(arr, 99)) * 1000, 4),
+        "mean_ms": round(float(arr.mean()) * 1000, 4),
+        "total_s": round(float(arr.sum()), 4),
+        "throughput": round(units / float(arr.sum()), 2) if arr.sum() > 0 else None,
+        "throughput_unit": unit_name
+    }
+
+def timed(fn: Callable[[], Any], repeats: int) -> List[float]:
+    """Seconds taken by each of repeats calls"""
+    times = []
+    for _ in range(repeats):
+        gc.collect()
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return times
+
+def peak_memory(fn: Callable[[], Any]) -> int:
+    """Peak bytes traced by tracemalloc while fn runs (numpy buffers included)"""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def build_index() -> RAGService:
+    """Start a service the way the API does: load the index, building it from Config.DATA_SOURCES if stale"""
+    service = RAGService()
+    service.initialize_embedding_model()
+    service.load_portfolio_data()
+    return service
+
+def bench_scale(corpus: str, args, rng: np.random.Generator) -> Dict[str, Any]:
+    """Run every stage on one corpus, written to a file and indexed into a temporary directory"""
+    workdir = tempfile.mkdtemp(prefix="bench_ingestion_")
+    data_path = os.path.join(workdir, "corpus.txt")
+    index_root = os.path.join(workdir, "index")
+    original_sources, original_path = Config.DATA_SOURCES, Config.CHROMA_DB_PATH
+    Config.DATA_SOURCES = [data_path]
+    Config.CHROMA_DB_PATH = index_root
+    corpus_mb = len(corpus.encode("utf-8")) / MB
+    stages: Dict[str, Dict[str, Any]] = {}
+
+    def record(stage: str, times: List[float], units: float, unit_name: str, fn: Callable[[], Any]):
+        stages[stage] = latency_summary(times, units, unit_name)
+        if not args.no_memory:
+            stages[stage]["peak_memory_mb"] = round(peak_memory(fn) / MB, 3)
+        print(f"  {stage:<20} p50 {stages[stage]['p50_ms']:>10.3f} ms  p99 {stages[stage]['p99_ms']:>10.3f} ms  "
+              f"{stages[stage]['throughput']} {unit_name}"
+              + (f"  peak {stages[stage]['peak_memory_mb']} MB" if not args.no_memory else ""))
+
+    def write_corpus(text: str):
+        with open(data_path, "w", encoding="utf-8") as f:
+            f.write(text)
+
+    def full_build() -> RAGService:
+        shutil.rmtree(index_root, ignore_errors=True)
+        return build_index()
+
+    edits = 0
+
+    def incremental_build() -> RAGService:
+        # One new section: every other section reuses its chunks (and dense embeddings)
+        nonlocal edits
+        edits += 1
+        write_corpus(f"{corpus}\n## BENCHMARK UPDATE {edits}\n\n- Incremental rebuild number {edits}.\n")
+        return build_index()
+
+    try:
+        write_corpus(corpus)
+
+        # Full build from the sources: streaming, chunking, vectorizing, encoding and saving
+        times = []
+        for _ in range(args.repeats):
+            shutil.rmtree(index_root, ignore_errors=True)
+            gc.collect()
+            start = time.perf_counter()
+            build_index()
+            times.append(time.perf_counter() - start)
+        record("load_portfolio_data", times, corpus_mb * args.repeats, "MB/s", full_build)
+        service = full_build()
+        sections, chunks = service.ingestion_stats["sections"], service.ingestion_stats["chunks"]
+
+        times = timed(incremental_build, args.repeats)
+        record("incremental_rebuild", times, corpus_mb * args.repeats, "MB/s", incremental_build)
+
+        # Restart with unchanged sources: the saved index is memory-mapped, nothing is rebuilt
+        service = build_index()
+        times = timed(build_index, args.repeats)
+        record("startup_load", times, len(service.documents) * args.repeats, "chunks/s", build_index)
+
+        # Uncached retrieval: caches are cleared outside the timed region
+        queries = synthetic_queries(corpus, args.queries, rng)
+        times = []
+        for query in queries:
+            service.query_vector_cache.clear()
+            service.retrieval_cache.clear()
+            start = time.perf_counter()
+            service.query_documents(query, n_results=args.top_k)
+            times.append(time.perf_counter() - start)
+        record("query_documents", times, len(queries), "queries/s",
+               lambda: [service.query_documents(query, n_results=args.top_k) for query in queries])
+
+        # Index persistence, through the service's own save/load paths
+        n_documents = len(service.documents)
+        times = timed(service.save_vectors, args.repeats)
+        record("save_vectors", times, n_documents * args.repeats, "chunks/s", service.save_vectors)
+        index_bytes = sum(
+            os.path.getsize(os.path.join(root, name))
+            for root, _, names in os.walk(index_root) for name in names
+        )
+
+        loader = RAGService()
+        times = timed(loader.load_vectors, args.repeats)
+        record("load_vectors", times, n_documents * args.repeats, "chunks/s", loader.load_vectors)
+    finally:
+        Config.DATA_SOURCES, Config.CHROMA_DB_PATH = original_sources, original_path
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        "corpus_mb": round(corpus_mb, 3),
+        "sections": sections,
+        "chunks": chunks,
+        "index_mb": round(index_bytes / MB, 3),
+        "stages": stages
+    }
+
+def compare(current: Dict[str, Any], baseline_path: str):
+    """Print p50 and throughput ratios against an earlier results file"""
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    print(f"\nComparison with {baseline_path} (p50 ratio < 1 is faster)")
+    print(f"{'scale':>6} {'stage':<20} {'p50 ratio':>10} {'throughput ratio':>17}")
+    for scale, result in current["results"].items():
+        old = baseline.get("results", {}).get(scale)
+        if old is None:
+            continue
+        for stage, stats in result["stages"].items():
+            old_stats = old["stages"].get(stage)
+            if not old_stats or not old_stats["p50_ms"] or not old_stats["throughput"]:
+                continue
+            print(f"{scale:>6} {stage:<20} {stats['p50_ms'] / old_stats['p50_ms']:>10.2f} "
+                  f"{stats['throughput'] / old_stats['throughput']:>17.2f}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scales", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--repeats", type=int, default=3, help="runs of each whole-corpus stage")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--shards", type=int, default=Config.RETRIEVAL_SHARDS, help="RETRIEVAL_SHARDS for query_documents")
+    parser.add_argument("--vectorizer", choices=["tfidf", "hashing"], default=Config.VECTORIZER)
+    parser.add_argument("--workers", type=int, default=Config.INGEST_WORKERS, help="INGEST_WORKERS for hashing")
+    parser.add_argument("--data-file", default=os.path.join(BACKEND_DIR, Config.DATA_FILE))
+    parser.add_argument("--output", help="results JSON path (default: benchmarks/results/<timestamp>.json)")
+    parser.add_argument("--compare", help="earlier results JSON to compare against")
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc peak-memory runs")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    Config.RETRIEVAL_SHARDS = args.shards
+    Config.VECTORIZER = args.vectorizer
+    Config.INGEST_WORKERS = args.workers
+    with open(args.data_file, "r", encoding="utf-8") as f:
+        base_text = f.read()
+
+    rng = np.random.default_rng(args.seed)
+    results = {}
+    for scale in args.scales:
+        corpus = synthetic_corpus(base_text, scale, rng)
+        print(f"scale {scale}x ({len(corpus) / MB:.1f} MB)")
+        results[str(scale)] = bench_scale(corpus, args, rng)
+
+    import sklearn
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "numpy": np.__version__,
+            "sklearn": sklearn.__version__,
+            "cpu_count": os.cpu_count()
+        },
+        "args": vars(args),
+        "results": results
+    }
+
+    output = args.output or os.path.join(RESULTS_DIR, time.strftime("bench_ingestion-%Y%m%d-%H%M%S.json"))
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nWrote {output}")
+
+    if args.compare:
+        compare(report, args.compare)
+
+if __name__ == "__main__":
+    main()
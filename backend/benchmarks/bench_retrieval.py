@@ -0,0 +1,79 @@
+# bench_retrieval.py - Brute-force cosine vs inverted-index retrieval at scale
+"""Compare the original cosine_similarity + argsort scoring with SparseRetrievalEngine
+(one query at a time and batched through search_batch).
+
+Usage (from backend/):
+    python benchmarks/bench_retrieval.py --sizes 10000 100000 1000000
+"""
+import argparse
+import os
+import sys
+import time
+import numpy as np
+from scipy import sparse
+from sklearn.metrics.pairwise import cosine_similarity
+from sklearn.preprocessing import normalize
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from retrieval import SparseRetrievalEngine
+
+N_FEATURES = 1000  # Matches TfidfVectorizer(max_features=1000)
+
+def synthetic_tfidf(n_docs: int, terms_per_doc: int, rng: np.random.Generator):
+    """Random L2-normalized TF-IDF-like rows with a Zipfian term distribution"""
+    ranks = np.arange(1, N_FEATURES + 1)
+    term_probs = (1.0 / ranks) / np.sum(1.0 / ranks)
+    indices = rng.choice(N_FEATURES, size=n_docs * terms_per_doc, p=term_probs)
+    indptr = np.arange(0, n_docs * terms_per_doc + 1, terms_per_doc)
+    data = rng.random(n_docs * terms_per_doc, dtype=np.float32)
+    matrix = sparse.csr_matrix((data, indices, indptr), shape=(n_docs, N_FEATURES))
+    matrix.sum_duplicates()
+    return normalize(matrix)
+
+def synthetic_queries(n_queries: int, rng: np.random.Generator):
+    """Short queries of 2-4 mid-frequency terms"""
+    rows = []
+    for _ in range(n_queries):
+        terms = rng.choice(np.arange(20, N_FEATURES), size=rng.integers(2, 5), replace=False)
+        rows.append(sparse.csr_matrix((rng.random(terms.size), (np.zeros(terms.size, dtype=int), terms)),
+                                      shape=(1, N_FEATURES)))
+    return [normalize(row) for row in rows]
+
+def brute_force(query_vector, document_vectors, n_results: int):
+    """The original query_documents scoring: full cosine + full argsort"""
+    similarities = cosine_similarity(query_vector, document_vectors).flatten()
+    top_indices = np.argsort(similarities)[::-1][:n_results]
+    return [idx for idx in top_indices if similarities[idx] > 0]
+
+def time_per_query(fn, queries) -> float:
+    """Mean milliseconds per query"""
+    start = time.perf_counter()
+    for query in queries:
+        fn(query)
+    return (time.perf_counter() - start) * 1000 / len(queries)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--terms-per-doc", type=int, default=40)
+    parser.add_argument("--top-k", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    queries = synthetic_queries(args.queries, rng)
+
+    query_matrix = sparse.vstack(queries).tocsr()
+
+    print(f"{'chunks':>10} {'brute ms':>10} {'index ms':>10} {'batch ms':>10} {'speedup':>8}")
+    for n_docs in args.sizes:
+        document_vectors = synthetic_tfidf(n_docs, args.terms_per_doc, rng)
+        engine = SparseRetrievalEngine(document_vectors)
+
+        brute_ms = time_per_query(lambda q: brute_force(q, document_vectors, args.top_k), queries)
+        index_ms = time_per_query(lambda q: engine.search(q, args.top_k), queries)
+        batch_ms = time_per_query(lambda q: engine.search_batch(q, args.top_k), [query_matrix]) / len(queries)
+        print(f"{n_docs:>10} {brute_ms:>10.2f} {index_ms:>10.2f} {batch_ms:>10.2f} {brute_ms / index_ms:>7.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+# bench_vector_index.py - Exact vs HNSW dense retrieval as the number of chunks grows
+"""Benchmark exact (DenseIndex) against approximate (ChromaVectorIndex) dense search on
+synthetic clustered embeddings. For each corpus size it reports query p50/p99 latency,
+and recall@k against exact search for every ef_search setting, so the recall/latency
+trade-off can be picked before changing HNSW_EF_SEARCH in production.
+
+Usage (from backend/):
+    python benchmarks/bench_vector_index.py --sizes 10000 100000 --ef-search 16 64 256
+"""
+import argparse
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+from typing import Any, Dict
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from bench_ingestion import RESULTS_DIR, latency_summary
+from embeddings import l2_normalize
+from models import Config
+from retrieval import DenseIndex
+from vector_index import ChromaVectorIndex, hnsw_configuration, recall_at_k
+
+def synthetic_embeddings(n: int, dimension: int, rng: np.random.Generator) -> np.ndarray:
+    """Normalized vectors around a few hundred topic centroids, like real chunk embeddings"""
+    centroids = rng.standard_normal((256, dimension)).astype(np.float32)
+    topics = rng.integers(0, len(centroids), size=n)
+    return l2_normalize(centroids[topics] + 0.6 * rng.standard_normal((n, dimension)).astype(np.float32))
+
+def bench_size(n: int, args, rng: np.random.Generator) -> Dict[str, Any]:
+    """Exact and HNSW search over n synthetic chunks"""
+    dense_index = DenseIndex.from_float(synthetic_embeddings(n, args.dimension, rng), Config.EMBEDDING_DTYPE)
+    queries = synthetic_embeddings(args.queries, args.dimension, rng)
+    result: Dict[str, Any] = {"documents": n}
+
+    times, exact = [], []
+    for query in queries:
+        start = time.perf_counter()
+        exact.append(dense_index.search(query, args.top_k)[0])
+        times.append(time.perf_counter() - start)
+    result["exact"] = latency_summary(times, len(queries), "queries/s")
+    print(f"  exact          p50 {result['exact']['p50_ms']:>8.3f} ms  p99 {result['exact']['p99_ms']:>8.3f} ms")
+
+    db_path = tempfile.mkdtemp(prefix="bench_hnsw_")
+    try:
+        vector_index = ChromaVectorIndex(
+            db_path,
+            "bench_vectors",
+            hnsw_configuration(Config.HNSW_EF_CONSTRUCTION, Config.HNSW_MAX_NEIGHBORS, args.ef_search[0]),
+            Config.VECTOR_INDEX_BATCH_SIZE
+        )
+        metadata = [{"section_title": "synthetic", "id": f"chunk_{row}"} for row in range(n)]
+        start = time.perf_counter()
+        vector_index.rebuild(dense_index, metadata, "bench")
+        result["hnsw_build_s"] = round(time.perf_counter() - start, 3)
+        print(f"  hnsw build     {result['hnsw_build_s']:.3f} s")
+
+        result["hnsw"] = {}
+        for ef_search in args.ef_search:
+            vector_index.set_ef_search(ef_search)
+            vector_index.search(queries[0], args.top_k)  # Reloads the graph outside the timed region
+            times, approximate = [], []
+            for query in queries:
+                start = time.perf_counter()
+                approximate.append(vector_index.search(query, args.top_k)[0])
+                times.append(time.perf_counter() - start)
+            stats = latency_summary(times, len(queries), "queries/s")
+            stats["recall_at_k"] = round(recall_at_k(approximate, exact), 4)
+            result["hnsw"][str(ef_search)] = stats
+            print(f"  hnsw ef={ef_search:<5}  p50 {stats['p50_ms']:>8.3f} ms  p99 {stats['p99_ms']:>8.3f} ms  "
+                  f"recall@{args.top_k} {stats['recall_at_k']}")
+    finally:
+        shutil.rmtree(db_path, ignore_errors=True)
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--ef-search", type=int, nargs="+", default=[16, 64, 256])
+    parser.add_argument("--dimension", type=int, default=384, help="all-MiniLM-L6-v2 embeddings are 384-d")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--output", help="results JSON path (default: benchmarks/results/<timestamp>.json)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    rng = np.random.default_rng(args.seed)
+    results = {}
+    for n in args.sizes:
+        print(f"{n} chunks ({args.dimension}-d, {Config.EMBEDDING_DTYPE})")
+        results[str(n)] = bench_size(n, args, rng)
+
+    output = args.output or os.path.join(RESULTS_DIR, time.strftime("bench_vector_index-%Y%m%d-%H%M%S.json"))
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump({"created": time.strftime("%Y-%m-%dT%H:%M:%S"), "args": vars(args), "results": results}, f, indent=2)
+    print(f"\nWrote {output}")
+
+if __name__ == "__main__":
+    main()
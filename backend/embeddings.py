@@ -0,0 +1,75 @@
+# embeddings.py - Pluggable dense embedding backends for hybrid retrieval
+import logging
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Sequence
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+def l2_normalize(vectors: np.ndarray) -> np.ndarray:
+    """Row-wise L2 normalization (zero rows stay zero)"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+class EmbeddingBackend(ABC):
+    """Interface for dense text encoders: texts -> float32 matrix, one row per text"""
+    name = ""
+
+    @abstractmethod
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """Embed texts (not necessarily normalized), one float32 row per text"""
+
+class OnnxMiniLMBackend(EmbeddingBackend):
+    """all-MiniLM-L6-v2 on onnxruntime (CPU only, no torch), via the embedding function shipped with chromadb
+
+    The model (~90 MB) is downloaded to ~/.cache/chroma on first use.
+    """
+    name = "onnx-minilm"
+
+    def __init__(self):
+        from chromadb.utils.embedding_functions import ONNXMiniLM_L6_V2
+        self._model = ONNXMiniLM_L6_V2(preferred_providers=["CPUExecutionProvider"])
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        return np.asarray(self._model(list(texts)), dtype=np.float32)
+
+class SentenceTransformerBackend(EmbeddingBackend):
+    """Any sentence-transformers model on CPU (requires the optional sentence-transformers package)"""
+
+    def __init__(self, model_name: str):
+        from sentence_transformers import SentenceTransformer
+        self.name = model_name
+        self._model = SentenceTransformer(model_name, device="cpu")
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        return self._model.encode(list(texts), batch_size=max(len(texts), 1), convert_to_numpy=True)
+
+def create_embedding_backend(name: str) -> Optional[EmbeddingBackend]:
+    """Backend for Config.EMBEDDING_MODEL: "tfidf" (sparse only), "onnx-minilm", or a sentence-transformers model"""
+    if name == "tfidf":
+        return None
+    if name == "onnx-minilm":
+        return OnnxMiniLMBackend()
+    return SentenceTransformerBackend(name)
+
+def encode_documents(backend: EmbeddingBackend, texts: Sequence[str], batch_size: int, workers: int) -> np.ndarray:
+    """Encode texts in batches, several batches at a time (ONNX and torch release the GIL)
+
+    texts may be a lazy sequence (e.g. a DocumentStore): only workers batches of text
+    are materialized at once.
+    """
+    if not len(texts):
+        return np.empty((0, 0), dtype=np.float32)
+    starts = range(0, len(texts), batch_size)
+    window = max(workers, 1) * batch_size
+    parts = []
+    with ThreadPoolExecutor(max_workers=max(workers, 1), thread_name_prefix="embed") as pool:
+        for window_start in range(0, len(texts), window):
+            batches = [texts[start:start + batch_size]
+                       for start in range(window_start, min(window_start + window, len(texts)), batch_size)]
+            parts.extend(pool.map(backend.encode, batches))
+    logger.info(f"Encoded {len(texts)} chunks with {backend.name} in {len(starts)} batches")
+    return l2_normalize(np.vstack(parts))
@@ -0,0 +1,86 @@
+# health.py - Background LLM dependency prober, so health endpoints never call the provider inline
+import asyncio
+import logging
+import time
+from typing import Any, Dict, Optional
+from llm_client import AsyncLLMClient
+
+logger = logging.getLogger(__name__)
+
+class LLMProber:
+    """Pings the LLM provider every interval seconds and keeps the latest result for /health"""
+
+    def __init__(self, client: AsyncLLMClient, interval: float, timeout: float, stale_after: float):
+        self.client = client
+        self.interval = interval
+        self.timeout = timeout
+        self.stale_after = stale_after
+        self.last_success: Optional[float] = None  # wall-clock timestamps
+        self.last_failure: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.latency: Optional[float] = None  # seconds taken by the last successful probe
+        self.consecutive_failures = 0
+        self.checks = 0
+        self._task: Optional[asyncio.Task] = None
+
+    async def probe_once(self) -> bool:
+        """Run one probe and record its outcome; returns True on success"""
+        self.checks += 1
+        start_time = time.perf_counter()
+        try:
+            # wait_for bounds the whole probe, including connection setup and pool waits
+            await asyncio.wait_for(self.client.ping(timeout=self.timeout), self.timeout)
+        except Exception as e:
+            self.last_failure = time.time()
+            self.last_error = str(e) or type(e).__name__
+            self.consecutive_failures += 1
+            logger.warning(f"LLM probe failed ({self.consecutive_failures} in a row): {self.last_error}")
+            return False
+        self.latency = time.perf_counter() - start_time
+        self.last_success = time.time()
+        self.consecutive_failures = 0
+        return True
+
+    async def _run(self):
+        while True:
+            await self.probe_once()
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        """Start probing on the running event loop (no-op if already running or disabled)"""
+        if self.interval <= 0 or (self._task is not None and not self._task.done()):
+            return
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        """Cancel the probe loop"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    @property
+    def status(self) -> str:
+        """Return "connected", "error" (last probe failed or success is stale) or "unknown" (no probe yet)"""
+        if self.last_success is None and self.last_failure is None:
+            return "unknown"
+        if self.consecutive_failures or time.time() - (self.last_success or 0) > self.stale_after:
+            return "error"
+        return "connected"
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Latest probe results for the dependency check"""
+        return {
+            "status": self.status,
+            "last_success": self.last_success,
+            "last_failure": self.last_failure,
+            "last_error": self.last_error,
+            "latency_ms": round(self.latency * 1000, 1) if self.latency is not None else None,
+            "consecutive_failures": self.consecutive_failures,
+            "checks": self.checks,
+            "interval": self.interval
+        }
@@ -0,0 +1,277 @@
+# index_store.py - Pickle-free, memory-mapped on-disk index format
+#
+# Layout of an index directory:
+#   meta.json            format version, matrix shape, vectorizer parameters
+#   postings_data.npy    float32  } L2-normalized term x document CSR matrix
+#   postings_indices.npy int32    } (one posting list per vocabulary term)
+#   postings_indptr.npy  int32/64 }
+#   vocabulary.txt       one term per line, ordered by column index (absent for hashed features)
+#   idf.npy              float32 IDF weight per term
+#   documents.npy        uint8 UTF-8 blob of every section, back to back
+#   doc_spans.npy        int64 (start, end) byte offsets of each chunk into the blob;
+#                        overlapping chunks share their bytes
+#   section_index.npy / chunk_index.npy / section_titles.json   chunk metadata
+#   dense_vectors.npy    optional int8/float16 chunk embeddings (dense_scales.npy for int8)
+#
+# Every .npy file is opened with mmap_mode='r', so loading is close to zero-copy
+# and all worker processes share one page-cached copy of the index.
+import json
+import logging
+import os
+import pickle
+import shutil
+from collections.abc import Sequence
+from typing import Any, Dict, List, Optional
+import numpy as np
+from scipy import sparse
+from sklearn.feature_extraction.text import TfidfVectorizer
+from retrieval import DenseIndex, SparseRetrievalEngine
+
+logger = logging.getLogger(__name__)
+
+INDEX_FORMAT_VERSION = 2
+LEGACY_PICKLES = ("tfidf_vectors.pkl", "tfidf_vectorizer.pkl", "documents.pkl")
+
+class DocumentStore(Sequence):
+    """Read-only list of chunk texts backed by one UTF-8 blob and a (start, end) span table
+
+    Texts are decoded on access, so only the chunks a prompt or search result uses are
+    ever materialized.
+    """
+
+    def __init__(self, blob: np.ndarray, spans: np.ndarray):
+        self._blob = blob
+        self._spans = spans
+
+    def __len__(self) -> int:
+        return len(self._spans)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(len(self)))]
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError("document index out of range")
+        start, end = self._spans[idx]
+        return self._blob[start:end].tobytes().decode("utf-8")
+
+    def spans(self, start: int, end: int) -> np.ndarray:
+        """Spans of documents start..end-1, relative to where the first one begins"""
+        spans = np.asarray(self._spans[start:end], dtype=np.int64)
+        return spans - spans[0, 0] if len(spans) else spans
+
+class DocumentSelection(Sequence):
+    """Lazy view of the documents of a DocumentStore (or list) at the given positions"""
+
+    def __init__(self, documents, positions: np.ndarray):
+        self._documents = documents
+        self._positions = positions
+
+    def __len__(self) -> int:
+        return len(self._positions)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self._documents[int(i)] for i in self._positions[idx]]
+        return self._documents[int(self._positions[idx])]
+
+class MetadataTable(Sequence):
+    """Read-only list of chunk metadata dicts rebuilt from compact per-chunk arrays"""
+
+    def __init__(self, section_titles: List[str], section_index: np.ndarray, chunk_index: np.ndarray):
+        self._section_titles = section_titles
+        self._section_index = section_index
+        self._chunk_index = chunk_index
+
+    def __len__(self) -> int:
+        return len(self._section_index)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(len(self)))]
+        section, chunk = int(self._section_index[idx]), int(self._chunk_index[idx])
+        return {
+            'section_title': self._section_titles[section],
+            'chunk_index': chunk,
+            'section_index': section,
+            'id': f"section_{section}_chunk_{chunk}"
+        }
+
+def _vectorizer_params(vectorizer: TfidfVectorizer) -> Dict[str, Any]:
+    """JSON-serializable constructor parameters of a vectorizer"""
+    return {
+        key: list(value) if isinstance(value, tuple) else value
+        for key, value in vectorizer.get_params().items()
+        if isinstance(value, (str, int, float, bool, tuple, list, type(None)))
+    }
+
+def _restore_vectorizer(params: Dict[str, Any], vocabulary: Optional[List[str]], idf: np.ndarray):
+    """Rebuild a fitted vectorizer from its parameters, vocabulary and IDF weights
+
+    Without a vocabulary the features are hashed: a HashingTfidfVectorizer is returned.
+    """
+    params = {key: tuple(value) if key == 'ngram_range' else value for key, value in params.items()}
+    if vocabulary is None:
+        from vectorizer import HashingTfidfVectorizer
+        vectorizer = HashingTfidfVectorizer(**params)
+        vectorizer.idf_ = idf
+        return vectorizer
+    vectorizer = TfidfVectorizer(**params)
+    vectorizer.vocabulary_ = {term: i for i, term in enumerate(vocabulary)}
+    vectorizer.idf_ = np.asarray(idf, dtype=np.float64)
+    return vectorizer
+
+def _section_titles_and_positions(metadata) -> Dict[str, Any]:
+    """Compact form of per-chunk metadata: unique section titles + two int arrays"""
+    if isinstance(metadata, MetadataTable):
+        return {'titles': metadata._section_titles, 'section_index': metadata._section_index,
+                'chunk_index': metadata._chunk_index}
+    section_titles: Dict[int, str] = {}
+    section_index = np.empty(len(metadata), dtype=np.int32)
+    chunk_index = np.empty(len(metadata), dtype=np.int32)
+    for i, item in enumerate(metadata):
+        section_titles[item['section_index']] = item['section_title']
+        section_index[i] = item['section_index']
+        chunk_index[i] = item['chunk_index']
+    titles = [section_titles.get(i, "") for i in range(max(section_titles, default=-1) + 1)]
+    return {'titles': titles, 'section_index': section_index, 'chunk_index': chunk_index}
+
+def index_exists(directory: str) -> bool:
+    """True if directory holds a complete index in the current format"""
+    return os.path.exists(os.path.join(directory, "meta.json"))
+
+def save_index(directory: str, term_documents, vectorizer: TfidfVectorizer, documents, metadata,
+               dense: Optional[DenseIndex] = None, dense_model: Optional[str] = None):
+    """Write the index to directory, replacing any previous index atomically"""
+    tmp_dir = directory + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    term_documents = sparse.csr_matrix(term_documents)
+    np.save(os.path.join(tmp_dir, "postings_data.npy"), term_documents.data.astype(np.float32, copy=False))
+    np.save(os.path.join(tmp_dir, "postings_indices.npy"), term_documents.indices)
+    np.save(os.path.join(tmp_dir, "postings_indptr.npy"), term_documents.indptr)
+
+    hashed = not hasattr(vectorizer, 'vocabulary_')
+    if not hashed:
+        vocabulary = sorted(vectorizer.vocabulary_, key=vectorizer.vocabulary_.get)
+        with open(os.path.join(tmp_dir, "vocabulary.txt"), "w", encoding="utf-8") as f:
+            f.write("\n".join(vocabulary))
+    np.save(os.path.join(tmp_dir, "idf.npy"), vectorizer.idf_.astype(np.float32))
+
+    if isinstance(documents, DocumentStore):
+        # Already one blob (e.g. the ingestion spool): copied as is, never decoded
+        blob, spans = documents._blob, documents._spans
+    else:
+        encoded = [document.encode("utf-8") for document in documents]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(chunk) for chunk in encoded], out=offsets[1:])
+        spans = np.column_stack((offsets[:-1], offsets[1:]))
+        blob = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+    np.save(os.path.join(tmp_dir, "documents.npy"), blob)
+    np.save(os.path.join(tmp_dir, "doc_spans.npy"), np.asarray(spans, dtype=np.int64).reshape(-1, 2))
+
+    compact = _section_titles_and_positions(metadata)
+    np.save(os.path.join(tmp_dir, "section_index.npy"), compact['section_index'])
+    np.save(os.path.join(tmp_dir, "chunk_index.npy"), compact['chunk_index'])
+    with open(os.path.join(tmp_dir, "section_titles.json"), "w", encoding="utf-8") as f:
+        json.dump(compact['titles'], f)
+
+    meta = {
+        'version': INDEX_FORMAT_VERSION,
+        'shape': list(term_documents.shape),
+        'vectorizer': 'hashing' if hashed else 'tfidf',
+        'vectorizer_params': _vectorizer_params(vectorizer)
+    }
+    if dense is not None:
+        np.save(os.path.join(tmp_dir, "dense_vectors.npy"), np.asarray(dense.vectors))
+        if dense.scales is not None:
+            np.save(os.path.join(tmp_dir, "dense_scales.npy"), np.asarray(dense.scales))
+        meta['dense'] = {'model': dense_model, 'dtype': dense.dtype, 'dimension': dense.dimension}
+
+    # meta.json is written last: its presence marks the index as complete
+    with open(os.path.join(tmp_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+
+    old_dir = directory + ".old"
+    shutil.rmtree(old_dir, ignore_errors=True)
+    if os.path.exists(directory):
+        os.replace(directory, old_dir)
+    os.replace(tmp_dir, directory)
+    shutil.rmtree(old_dir, ignore_errors=True)
+    logger.info(f"Saved index with {len(spans)} documents to {directory}")
+
+def load_index(directory: str) -> Dict[str, Any]:
+    """Memory-map an index written by save_index"""
+    with open(os.path.join(directory, "meta.json"), "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    if meta.get('version') != INDEX_FORMAT_VERSION:
+        raise ValueError(f"Unsupported index format version: {meta.get('version')}")
+
+    def mmap(name: str) -> np.ndarray:
+        return np.load(os.path.join(directory, name), mmap_mode='r')
+
+    # copy=False keeps the matrix pointing at the mapped pages
+    term_documents = sparse.csr_matrix(
+        (mmap("postings_data.npy"), mmap("postings_indices.npy"), mmap("postings_indptr.npy")),
+        shape=tuple(meta['shape']),
+        copy=False
+    )
+
+    vocabulary = None
+    if meta.get('vectorizer', 'tfidf') == 'tfidf':
+        with open(os.path.join(directory, "vocabulary.txt"), "r", encoding="utf-8") as f:
+            vocabulary = f.read().split("\n")
+    vectorizer = _restore_vectorizer(meta['vectorizer_params'], vocabulary, mmap("idf.npy"))
+
+    with open(os.path.join(directory, "section_titles.json"), "r", encoding="utf-8") as f:
+        section_titles = json.load(f)
+
+    dense = None
+    if 'dense' in meta:
+        has_scales = os.path.exists(os.path.join(directory, "dense_scales.npy"))
+        dense = DenseIndex(mmap("dense_vectors.npy"), mmap("dense_scales.npy") if has_scales else None)
+
+    return {
+        'term_documents': term_documents,
+        'vectorizer': vectorizer,
+        'documents': DocumentStore(mmap("documents.npy"), mmap("doc_spans.npy")),
+        'metadata': MetadataTable(section_titles, mmap("section_index.npy"), mmap("chunk_index.npy")),
+        'dense': dense,
+        'dense_model': meta.get('dense', {}).get('model')
+    }
+
+def has_legacy_pickles(db_path: str) -> bool:
+    """Whether db_path holds an index pickled by earlier versions of save_vectors"""
+    return all(os.path.exists(os.path.join(db_path, name)) for name in LEGACY_PICKLES)
+
+def migrate_pickles(db_path: str, directory: str) -> bool:
+    """Convert the legacy pickled index in db_path into the mmap format; returns True on success
+
+    Offline use only (python index_store.py): the service never loads a migrated index
+    on its own, since there is no manifest of the sources it was built from, and rebuilds
+    from the knowledge base instead.
+    """
+    if not has_legacy_pickles(db_path):
+        return False
+    paths = [os.path.join(db_path, name) for name in LEGACY_PICKLES]
+
+    # Local files written by earlier versions of save_vectors
+    with open(paths[0], 'rb') as f:
+        document_vectors = pickle.load(f)
+    with open(paths[1], 'rb') as f:
+        vectorizer = pickle.load(f)
+    with open(paths[2], 'rb') as f:
+        data = pickle.load(f)
+
+    engine = SparseRetrievalEngine(document_vectors)
+    save_index(directory, engine.term_documents, vectorizer, data['documents'], data['metadata'])
+    logger.info(f"Migrated pickled index in {db_path} to {directory}")
+    return True
+
+if __name__ == "__main__":
+    from models import Config
+    logging.basicConfig(level=logging.INFO)
+    if not migrate_pickles(Config.CHROMA_DB_PATH, os.path.join(Config.CHROMA_DB_PATH, Config.INDEX_DIR)):
+        logger.error(f"No pickled index found in {Config.CHROMA_DB_PATH}")
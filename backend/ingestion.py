@@ -0,0 +1,370 @@
+# ingestion.py - Streaming, bounded-memory ingestion: sources -> lines -> ## sections -> chunks
+#
+# Every stage is a generator, so only the current section is held in memory. Chunks
+# are (start, end) byte spans into their section: section texts go once to an on-disk
+# spool (DocumentWriter), and chunk text is only decoded for the vectorizer and reads.
+import glob
+import hashlib
+import logging
+import multiprocessing
+import os
+import re
+import time
+from array import array
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+READ_BLOCK_SIZE = 1 << 20  # bytes per read when hashing sources
+
+# Tokens as counted by prompt.estimate_tokens: runs of \w characters, and every other
+# non-\s character on its own. A chunk may end after a sentence end or before a newline.
+_WORD_RE = re.compile(r"\w")
+_SPACE_RE = re.compile(r"\s")
+_SENTENCE_ENDS = ".!?"
+_ASCII_WORD = np.array([bool(_WORD_RE.match(chr(c))) for c in range(128)])
+_ASCII_SPACE = np.array([bool(_SPACE_RE.match(chr(c))) for c in range(128)])
+_ASCII_SENTENCE_END = np.array([chr(c) in _SENTENCE_ENDS for c in range(128)])
+
+def resolve_sources(sources: Sequence[str], extensions: Sequence[str]) -> List[str]:
+    """Expand files, directories (recursively, by extension) and glob patterns, in a stable order"""
+    paths: List[str] = []
+    for source in sources:
+        if os.path.isdir(source):
+            matches = [
+                os.path.join(root, name)
+                for root, _, names in os.walk(source)
+                for name in names
+                if name.lower().endswith(tuple(extensions))
+            ]
+        elif glob.has_magic(source):
+            matches = [path for path in glob.glob(source, recursive=True) if os.path.isfile(path)]
+        else:
+            matches = [source]  # Missing files raise when they are read
+        paths.extend(sorted(matches))
+    return list(dict.fromkeys(paths))
+
+def hash_sources(paths: Sequence[str]) -> str:
+    """sha256 over every source's name and content, read in fixed-size blocks"""
+    digest = hashlib.sha256()
+    for path in paths:
+        digest.update(path.encode("utf-8") + b"\0")
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(READ_BLOCK_SIZE), b""):
+                digest.update(block)
+    return digest.hexdigest()
+
+class IngestionProgress:
+    """Byte, section and chunk counters with periodic throughput logging"""
+
+    def __init__(self, total_bytes: int, log_interval: float):
+        self.total_bytes = total_bytes
+        self.log_interval = log_interval
+        self.bytes_read = 0
+        self.sections = 0
+        self.chunks = 0
+        self.start_time = time.perf_counter()
+        self._last_log = self.start_time
+
+    def update(self, bytes_read: int = 0, sections: int = 0, chunks: int = 0):
+        self.bytes_read += bytes_read
+        self.sections += sections
+        self.chunks += chunks
+        now = time.perf_counter()
+        if now - self._last_log >= self.log_interval:
+            self._last_log = now
+            self.log()
+
+    def log(self):
+        stats = self.stats()
+        logger.info(
+            f"Ingested {stats['mb']:.1f}/{self.total_bytes / 1e6:.1f} MB ({stats['mb_per_s']:.1f} MB/s), "
+            f"{self.sections} sections, {self.chunks} chunks ({stats['chunks_per_s']:.0f} chunks/s)"
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        seconds = max(time.perf_counter() - self.start_time, 1e-9)
+        return {
+            "sources_mb": round(self.total_bytes / 1e6, 3),
+            "mb": round(self.bytes_read / 1e6, 3),
+            "sections": self.sections,
+            "chunks": self.chunks,
+            "seconds": round(seconds, 3),
+            "mb_per_s": round(self.bytes_read / 1e6 / seconds, 3),
+            "chunks_per_s": round(self.chunks / seconds, 1)
+        }
+
+def read_lines(path: str, progress: Optional[IngestionProgress] = None) -> Iterator[str]:
+    """Lines of a UTF-8 file without their trailing newline, streamed"""
+    with open(path, "rb") as f:
+        for raw in f:
+            if progress is not None:
+                progress.update(bytes_read=len(raw))
+            line = raw.decode("utf-8")
+            yield line[:-1] if line.endswith("\n") else line
+
+def iter_sections(lines: Iterable[str], source: str = "") -> Iterator[Dict[str, str]]:
+    """Split a line stream into ## sections (### and deeper stay inside their section)
+
+    Lines are collected per section and joined once, so long sections cost linear time.
+    Text before the first ## header becomes a section with an empty title.
+    """
+    title, parts = "", []
+    for line in lines:
+        if line.startswith('##') and not line.startswith('###'):
+            content = "\n".join(parts).strip()
+            if content:
+                yield {'title': title, 'content': content, 'source': source}
+            title = line.replace('##', '').strip()
+            parts = [line]
+        else:
+            parts.append(line)
+
+    content = "\n".join(parts).strip()
+    if content:
+        yield {'title': title, 'content': content, 'source': source}
+
+def stream_sections(paths: Sequence[str], progress: Optional[IngestionProgress] = None) -> Iterator[Dict[str, str]]:
+    """Sections of every source in order, each with the sha256 of its content"""
+    for path in paths:
+        for section in iter_sections(read_lines(path, progress), source=path):
+            section['hash'] = hashlib.sha256(section['content'].encode("utf-8")).hexdigest()
+            if progress is not None:
+                progress.update(sections=1)
+            yield section
+
+def _byte_offsets(text: str) -> np.ndarray:
+    """UTF-8 byte offset of every character position of text (len(text) + 1 entries)"""
+    if text.isascii():
+        return np.arange(len(text) + 1, dtype=np.int64)
+    code_points = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32)
+    offsets = np.zeros(len(text) + 1, dtype=np.int64)
+    np.cumsum(1 + (code_points >= 0x80) + (code_points >= 0x800) + (code_points >= 0x10000), out=offsets[1:])
+    return offsets
+
+def _character_classes(codes: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Word and whitespace masks of code points: a table lookup, plus one regex match per
+    distinct non-ASCII character"""
+    ascii_codes = np.minimum(codes, 127)
+    word, space = _ASCII_WORD[ascii_codes], _ASCII_SPACE[ascii_codes]
+    wide = codes > 127
+    if wide.any():
+        unique, inverse = np.unique(codes[wide], return_inverse=True)
+        word[wide] = np.array([bool(_WORD_RE.match(chr(c))) for c in unique])[inverse]
+        space[wide] = np.array([bool(_SPACE_RE.match(chr(c))) for c in unique])[inverse]
+    return word, space
+
+def _tokens(text: str) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Token start and end character positions, estimated costs, and whether a chunk may
+    end after each token, computed from character-class masks in one vectorized pass"""
+    codes = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32)
+    word, space = _character_classes(codes)
+    symbol = ~(word | space)
+    first = word.copy()
+    first[1:] &= ~word[:-1]
+    last = word.copy()
+    last[:-1] &= ~word[1:]
+    starts = (first | symbol).nonzero()[0]
+    ends = (last | symbol).nonzero()[0] + 1
+
+    # Sentence-ending symbols, and the last token before each newline
+    breaks = _ASCII_SENTENCE_END[np.minimum(codes[starts], 127)]
+    before_newline = ends.searchsorted((codes == 10).nonzero()[0], side='right') - 1
+    breaks[before_newline[before_newline >= 0]] = True
+    return starts, ends, 1 + (ends - starts) // 8, breaks
+
+def chunk_spans(text: str, chunk_tokens: int, overlap_tokens: int) -> np.ndarray:
+    """(start, end) UTF-8 byte offsets of overlapping chunks of text, sized in estimated tokens
+
+    One vectorized pass finds every token (counted as prompt.estimate_tokens does) and
+    the sentence or line ends after which a chunk may stop. A chunk holds at most
+    chunk_tokens and ends at the last such boundary past its midpoint, else at a token
+    edge; the next one starts overlap_tokens earlier. Spans never include surrounding
+    whitespace, and no chunk text is built.
+    """
+    starts, ends, costs, breaks = _tokens(text)
+    n_tokens = len(starts)
+    if n_tokens == 0:
+        return np.empty((0, 2), dtype=np.int64)
+
+    cumulative = np.zeros(n_tokens + 1, dtype=np.int64)
+    np.cumsum(costs, out=cumulative[1:])
+    if cumulative[-1] <= chunk_tokens:
+        spans = [(int(starts[0]), int(ends[-1]))]
+    else:
+        boundaries = breaks.nonzero()[0]
+        spans = []
+        first = 0
+        while True:
+            # Furthest end token that keeps the chunk within budget (always at least one token)
+            last = max(int(cumulative.searchsorted(cumulative[first] + chunk_tokens, side='right')) - 1, first + 1)
+            if last < n_tokens:
+                # Prefer the last sentence or line end in the second half of the chunk
+                i = int(boundaries.searchsorted(last - 1, side='right')) - 1
+                if i >= 0 and boundaries[i] >= first + (last - first) // 2:
+                    last = int(boundaries[i]) + 1
+            last = min(last, n_tokens)
+            spans.append((int(starts[first]), int(ends[last - 1])))
+            if last == n_tokens:
+                break
+            overlap_start = int(cumulative.searchsorted(cumulative[last] - overlap_tokens, side='left'))
+            first = max(overlap_start, first + 1)
+
+    offsets = _byte_offsets(text)
+    return offsets[np.asarray(spans, dtype=np.int64)]
+
+def chunk_text(text: str, chunk_tokens: int, overlap_tokens: int) -> List[str]:
+    """Materialized chunk_spans of text"""
+    encoded = text.encode("utf-8")
+    return [encoded[start:end].decode("utf-8") for start, end in chunk_spans(text, chunk_tokens, overlap_tokens)]
+
+def stream_spans(sections: Iterable[Dict[str, str]], chunker: Callable[[str], np.ndarray],
+                 reusable: Callable[[Dict[str, str]], Optional[np.ndarray]],
+                 section_log: List[Dict[str, str]],
+                 progress: Optional[IngestionProgress] = None) -> Iterator[Tuple[int, bytes, np.ndarray]]:
+    """(section number, UTF-8 content, chunk spans) for every section, reusing the previous
+    spans of unchanged sections
+
+    Each section's title and hash are appended to section_log for the index manifest.
+    """
+    for i, section in enumerate(sections):
+        section_log.append({'title': section['title'], 'hash': section['hash'], 'reused': False})
+        spans = reusable(section)
+        if spans is not None:
+            section_log[-1]['reused'] = True
+        else:
+            spans = chunker(section['content'])
+        if progress is not None:
+            progress.update(chunks=len(spans))
+        yield i, section['content'].encode("utf-8"), spans
+
+class DocumentWriter:
+    """Appends section texts to an on-disk UTF-8 spool; finish() maps it back as a DocumentStore
+
+    Each section is written once, with its chunks recorded as byte spans into it, so
+    overlapping chunks share their text. The spool stays mapped until the index is
+    saved and reopened; remove() deletes it once nothing maps it any more (some
+    platforms refuse to delete a mapped file).
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "wb")
+        self._size = 0
+        self._spans = array('q')
+
+    def append(self, encoded: bytes, spans: np.ndarray):
+        """Write one section's UTF-8 text and its chunk spans (relative to the section)"""
+        self._spans.frombytes((np.asarray(spans, dtype=np.int64) + self._size).tobytes())
+        self._file.write(encoded)
+        self._size += len(encoded)
+
+    def finish(self):
+        from index_store import DocumentStore
+        self._file.close()
+        spans = np.frombuffer(self._spans, dtype=np.int64).reshape(-1, 2)
+        if self._size:
+            blob = np.memmap(self.path, dtype=np.uint8, mode='r')
+        else:
+            blob = np.empty(0, dtype=np.uint8)  # Zero-length files cannot be mapped
+        return DocumentStore(blob, spans)
+
+    def remove(self):
+        """Delete the spool; call after every DocumentStore from finish() is released"""
+        try:
+            os.remove(self.path)
+        except OSError as e:
+            logger.warning(f"Could not remove ingestion spool {self.path}: {e}")
+
+def _chunk_and_count(items: List[Tuple[str, Optional[np.ndarray]]], chunk_tokens: int, overlap_tokens: int,
+                     vectorizer) -> Tuple[List[np.ndarray], Any, Tuple[np.ndarray, np.ndarray]]:
+    """Worker task: chunk the changed sections of a partition and count their hashed features
+
+    Returns the chunk spans per section, the partition's count matrix and its document
+    frequencies in sparse form; chunk texts never leave the worker.
+    """
+    section_spans = [
+        spans if spans is not None else chunk_spans(content, chunk_tokens, overlap_tokens)
+        for content, spans in items
+    ]
+
+    def chunks():
+        for (content, _), spans in zip(items, section_spans):
+            encoded = content.encode("utf-8")
+            for start, end in spans:
+                yield encoded[start:end].decode("utf-8")
+
+    counts = vectorizer.count(chunks())
+    return section_spans, counts, vectorizer.document_frequencies(counts)
+
+def stream_partitions(sections: Iterable[Dict[str, str]],
+                      reusable: Callable[[Dict[str, str]], Optional[np.ndarray]],
+                      section_log: List[Dict[str, str]],
+                      partition_bytes: int) -> Iterator[List[Tuple[str, Optional[np.ndarray]]]]:
+    """Group sections into worker partitions of about partition_bytes of text
+
+    Items are (content, None) for sections to chunk and (content, spans) for reused ones.
+    """
+    partition, size = [], 0
+    for section in sections:
+        spans = reusable(section)
+        section_log.append({'title': section['title'], 'hash': section['hash'], 'reused': spans is not None})
+        partition.append((section['content'], spans))
+        size += len(section['content'])
+        if size >= partition_bytes:
+            yield partition
+            partition, size = [], 0
+    if partition:
+        yield partition
+
+def hashing_fit_transform(partitions: Iterable[List[Tuple[str, Optional[np.ndarray]]]], vectorizer,
+                          chunk_tokens: int, overlap_tokens: int, workers: int,
+                          sink: Callable[[int, bytes, np.ndarray], None],
+                          progress: Optional[IngestionProgress] = None):
+    """Chunk and count partitions in a process pool, then fit the IDF and weight all counts
+
+    Results are consumed in submission order with at most 2 * workers partitions in
+    flight, so memory holds the count matrices but never the whole corpus text.
+    Every section is passed to sink(section number, UTF-8 content, chunk spans) in
+    corpus order, as stream_spans yields them.
+    """
+    from scipy import sparse
+
+    df = np.zeros(vectorizer.n_features, dtype=np.int64)
+    matrices = []
+    section_number = 0
+
+    def collect(partition, result):
+        nonlocal section_number
+        section_spans, counts, (features, frequencies) = result
+        for (content, _), spans in zip(partition, section_spans):
+            sink(section_number, content.encode("utf-8"), spans)
+            section_number += 1
+            if progress is not None:
+                progress.update(chunks=len(spans))
+        df[features] += frequencies
+        matrices.append(counts)
+
+    if workers > 1:
+        # Spawned workers: forking a process that may already run threads is unsafe
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            pending = deque()
+            for partition in partitions:
+                pending.append((partition, pool.submit(_chunk_and_count, partition, chunk_tokens, overlap_tokens, vectorizer)))
+                if len(pending) >= 2 * workers:
+                    partition, future = pending.popleft()
+                    collect(partition, future.result())
+            while pending:
+                partition, future = pending.popleft()
+                collect(partition, future.result())
+    else:
+        for partition in partitions:
+            collect(partition, _chunk_and_count(partition, chunk_tokens, overlap_tokens, vectorizer))
+
+    counts = sparse.vstack(matrices, format='csr') if matrices else sparse.csr_matrix((0, vectorizer.n_features))
+    vectorizer.fit_idf(df, counts.shape[0])
+    return vectorizer.weight(counts)
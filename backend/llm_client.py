@@ -0,0 +1,92 @@
+# llm_client.py - Pooled async client for the Together AI completions API
+import json
+import logging
+from typing import Dict, Any, Optional, AsyncIterator
+import httpx
+from models import Config
+
+logger = logging.getLogger(__name__)
+
+class AsyncLLMClient:
+    """Async Together AI client that reuses a keep-alive HTTP connection pool"""
+
+    def __init__(self):
+        self._client: Optional[httpx.AsyncClient] = None
+
+    def _get_client(self) -> httpx.AsyncClient:
+        """Create the pooled HTTP client on first use"""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=Config.LLM_API_BASE,
+                headers={"Authorization": f"Bearer {Config.TOGETHER_API_KEY}"},
+                limits=httpx.Limits(
+                    max_connections=Config.LLM_POOL_SIZE,
+                    max_keepalive_connections=Config.LLM_POOL_SIZE,
+                    keepalive_expiry=Config.LLM_KEEPALIVE_EXPIRY
+                ),
+                timeout=httpx.Timeout(
+                    Config.LLM_TIMEOUT,
+                    connect=Config.LLM_CONNECT_TIMEOUT
+                )
+            )
+            logger.info(f"Created LLM connection pool (size={Config.LLM_POOL_SIZE})")
+        return self._client
+
+    def _build_payload(self, prompt: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        """Build the completion request body"""
+        payload = {"model": Config.LLM_MODEL, "prompt": prompt}
+        payload.update(params)
+        return payload
+
+    async def complete(self, prompt: str, timeout: Optional[float] = None, **params) -> Dict[str, Any]:
+        """Request a completion and return the decoded JSON response"""
+        client = self._get_client()
+        response = await client.post(
+            "/completions",
+            json=self._build_payload(prompt, params),
+            timeout=timeout if timeout is not None else httpx.USE_CLIENT_DEFAULT
+        )
+        response.raise_for_status()
+        return response.json()
+
+    async def stream_complete(self, prompt: str, timeout: Optional[float] = None, **params) -> AsyncIterator[str]:
+        """Stream completion text fragments as the provider emits them"""
+        client = self._get_client()
+        payload = self._build_payload(prompt, params)
+        payload["stream"] = True
+        
+        async with client.stream(
+            "POST",
+            "/completions",
+            json=payload,
+            timeout=timeout if timeout is not None else httpx.USE_CLIENT_DEFAULT
+        ) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                # Server-sent events: only "data:" lines carry payloads
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                
+                chunk = json.loads(data)
+                choices = chunk.get("choices") or []
+                if choices and choices[0].get("text"):
+                    yield choices[0]["text"]
+
+    async def ping(self, timeout: Optional[float] = None):
+        """Authenticated request that consumes no completion quota (lists models)"""
+        client = self._get_client()
+        response = await client.get(
+            "/models",
+            timeout=timeout if timeout is not None else httpx.USE_CLIENT_DEFAULT
+        )
+        response.raise_for_status()
+
+    async def aclose(self):
+        """Close the connection pool"""
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+            logger.info("Closed LLM connection pool")
+        self._client = None
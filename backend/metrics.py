@@ -0,0 +1,130 @@
+# metrics.py - Minimal Prometheus-format metrics: counters, gauges and histograms
+import bisect
+import threading
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# Default latency buckets (seconds), from sub-millisecond retrieval to slow LLM calls
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SIZE_BUCKETS = (64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768)
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in sorted(labels.items())) + "}"
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    """Monotonically increasing count"""
+    kind = "counter"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0
+
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self.value += amount
+
+    def samples(self, name: str, labels: Dict[str, str]) -> List[str]:
+        return [f"{name}{_format_labels(labels)} {_format_value(self.value)}"]
+
+class Gauge:
+    """Current value, either set directly or read from a callback at scrape time"""
+    kind = "gauge"
+
+    def __init__(self, func: Optional[Callable[[], float]] = None):
+        self._func = func
+        self.value = 0
+
+    def set(self, value: float):
+        self.value = value
+
+    def samples(self, name: str, labels: Dict[str, str]) -> List[str]:
+        value = self._func() if self._func is not None else self.value
+        return [f"{name}{_format_labels(labels)} {_format_value(value)}"]
+
+class CounterFunc(Gauge):
+    """Counter whose value is read from an existing counter attribute at scrape time"""
+    kind = "counter"
+
+class Histogram:
+    """Bucketed distribution; observe() is a bisect plus two additions"""
+    kind = "histogram"
+
+    def __init__(self, buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self._lock = threading.Lock()
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def samples(self, name: str, labels: Dict[str, str]) -> List[str]:
+        with self._lock:
+            counts, total, count = list(self._counts), self.sum, self.count
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += bucket_count
+            bucket_labels = dict(labels, le=_format_value(float(bound)))
+            lines.append(f"{name}_bucket{_format_labels(bucket_labels)} {cumulative}")
+        lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(total)}")
+        lines.append(f"{name}_count{_format_labels(labels)} {count}")
+        return lines
+
+class MetricsRegistry:
+    """Named metric families rendered in the Prometheus text exposition format"""
+
+    def __init__(self, prefix: str = ""):
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._families: Dict[str, Tuple[str, str, Dict[Tuple, object]]] = {}
+
+    def _register(self, name: str, help_text: str, metric, labels: Optional[Dict[str, str]]):
+        name = self.prefix + name
+        labels = labels or {}
+        with self._lock:
+            kind, _, members = self._families.setdefault(name, (metric.kind, help_text, {}))
+            if kind != metric.kind:
+                raise ValueError(f"Metric {name} already registered as a {kind}")
+            key = tuple(sorted(labels.items()))
+            # Registering the same name and labels again returns the existing metric
+            return members.setdefault(key, metric)
+
+    def counter(self, name: str, help_text: str, labels: Optional[Dict[str, str]] = None) -> Counter:
+        return self._register(name, help_text, Counter(), labels)
+
+    def counter_func(self, name: str, help_text: str, func: Callable[[], float],
+                     labels: Optional[Dict[str, str]] = None) -> CounterFunc:
+        return self._register(name, help_text, CounterFunc(func), labels)
+
+    def gauge(self, name: str, help_text: str, func: Optional[Callable[[], float]] = None,
+              labels: Optional[Dict[str, str]] = None) -> Gauge:
+        return self._register(name, help_text, Gauge(func), labels)
+
+    def histogram(self, name: str, help_text: str, buckets: Sequence[float] = LATENCY_BUCKETS,
+                  labels: Optional[Dict[str, str]] = None) -> Histogram:
+        return self._register(name, help_text, Histogram(buckets), labels)
+
+    def render(self) -> str:
+        """Every family in the text exposition format (version 0.0.4)"""
+        with self._lock:
+            families = [(name, kind, help_text, list(members.items()))
+                        for name, (kind, help_text, members) in self._families.items()]
+        lines = []
+        for name, kind, help_text, members in families:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for key, metric in members:
+                lines.extend(metric.samples(name, dict(key)))
+        return "\n".join(lines) + "\n"
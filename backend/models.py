@@ -1,5 +1,5 @@
 # models.py - Pydantic models and configuration
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import List, Dict, Any
 import os
 from dotenv import load_dotenv
@@ -26,20 +26,120 @@ class Config:
     ]
     CHROMA_DB_PATH = "./chroma_db"
     COLLECTION_NAME = "taofik_portfolio"
+    ENABLE_CHROMADB = os.getenv("ENABLE_CHROMADB", "false").lower() == "true"
     DATA_FILE = "akandi_data.txt"
+    # Knowledge base sources: comma-separated files, directories and glob patterns
+    DATA_SOURCES = [source.strip() for source in os.getenv("DATA_SOURCES", DATA_FILE).split(",") if source.strip()]
+    DATA_EXTENSIONS = (".txt", ".md")  # Files picked up when a source is a directory
+    INGEST_PROGRESS_INTERVAL = 5.0  # seconds between ingestion progress log lines
+    INDEX_MANIFEST_FILE = "index_manifest.json"  # Content hashes the saved index was built from
+    INDEX_DIR = "index"  # Memory-mapped index inside CHROMA_DB_PATH
     
-    # Model parameters - TF-IDF instead of sentence-transformers
-    EMBEDDING_MODEL = 'tfidf'  # Changed from sentence-transformer model
+    # Model parameters - TF-IDF, optionally fused with a local dense embedding model
+    VECTORIZER = os.getenv("VECTORIZER", "tfidf")  # "tfidf" (fitted vocabulary) or "hashing" (hashed n-grams)
+    HASHING_FEATURES = 2 ** 20  # Hashed feature space; memory does not depend on the vocabulary
+    INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", str(os.cpu_count() or 1)))  # Processes vectorizing partitions
+    INGEST_PARTITION_BYTES = 8 * 1024 * 1024  # Section text per worker task
+    EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "tfidf")  # "tfidf", "onnx-minilm" or a sentence-transformers model
+    EMBEDDING_DTYPE = os.getenv("EMBEDDING_DTYPE", "int8")  # Stored vectors: "int8", "float16" or "float32"
+    EMBEDDING_BATCH_SIZE = 64  # Chunks per encoder call at ingestion
+    EMBEDDING_WORKERS = max(1, (os.cpu_count() or 1) // 2)  # Batches encoded in parallel
+    HYBRID_DENSE_WEIGHT = 0.6  # Fused score = w * dense cosine + (1 - w) * TF-IDF cosine
+    
+    # Dense vector index: "exact" (brute force over the mapped embeddings, also the recall baseline)
+    # or "hnsw" (approximate search in the Chroma collection, sub-linear in the number of chunks)
+    VECTOR_INDEX = os.getenv("VECTOR_INDEX", "exact")
+    HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "64"))  # Candidates explored per query: recall vs latency
+    HNSW_EF_CONSTRUCTION = 200
+    HNSW_MAX_NEIGHBORS = 16  # Graph degree (M)
+    VECTOR_INDEX_BATCH_SIZE = 4096  # Embeddings written per Chroma call
+    ANN_CANDIDATE_FACTOR = 4  # ANN neighbours fetched per requested result before fusion
     LLM_MODEL = "mistralai/Mixtral-8x7B-Instruct-v0.1"
     MAX_TOKENS = 150
     TEMPERATURE = 0.7
     TOP_P = 0.8
     REPETITION_PENALTY = 1.2
+    STOP_SEQUENCES = ["</s>", "[INST]", "[/INST]", "FORBIDDEN", "User:", "Human:"]
+    
+    # Async LLM client settings (keep-alive connection pool)
+    LLM_API_BASE = os.getenv("LLM_API_BASE", "https://api.together.xyz/v1")
+    LLM_POOL_SIZE = int(os.getenv("LLM_POOL_SIZE", "32"))
+    LLM_KEEPALIVE_EXPIRY = 30.0  # seconds an idle connection is kept open
+    LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "30"))
+    LLM_CONNECT_TIMEOUT = 5.0
+    
+    # Background LLM dependency probe read by /health (never called inline by probes)
+    LLM_PROBE_INTERVAL = float(os.getenv("LLM_PROBE_INTERVAL", "60"))  # seconds; 0 disables probing
+    LLM_PROBE_TIMEOUT = 5.0  # seconds
+    LLM_PROBE_STALE_AFTER = 3 * LLM_PROBE_INTERVAL  # older successes report "error"
+    
+    # Admission control (per worker): bounded LLM concurrency with a bounded wait queue
+    LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+    LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "64"))  # Requests beyond this get a 503
+    LLM_MAX_QUEUE_WAIT = float(os.getenv("LLM_MAX_QUEUE_WAIT", "10"))  # seconds before a queued request gets a 503
+    OVERLOAD_RETRY_AFTER = 2  # Retry-After header value (seconds) on overload
+    DEGRADE_QUEUE_DEPTH = 1  # Queue depth at which prompts are trimmed
+    DEGRADED_CONTEXT_HISTORY_LIMIT = 2  # History messages kept in the prompt under load
+    DEGRADED_RETRIEVAL_RESULTS = 2  # Chunks retrieved under load
+    
+    # Response cache (answers keyed on query, retrieved chunks and history)
+    RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "512"))
+    RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "3600"))  # seconds
+    
+    # Query vector / retrieval result cache (entries per cache)
+    QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "1024"))
+    MAX_BATCH_QUERIES = 1000  # Upper bound for POST /search/batch
+    MAX_RESULTS = 50  # Upper bound for n_results per search query
+    
+    # Sharded retrieval: document shards scored in parallel on a per-worker thread pool (1 disables)
+    RETRIEVAL_SHARDS = int(os.getenv("RETRIEVAL_SHARDS", "1"))
+    SHARD_MIN_POSTINGS = 100000  # Lighter queries are scored on the calling thread
+    
+    # Readiness gating while the index loads in the background
+    READINESS_WAIT_TIMEOUT = 10.0  # seconds a request is held before a 503
+    READINESS_RETRY_AFTER = 5  # Retry-After header value (seconds) on 503
+    
+    # Production server (serve.py)
+    HOST = os.getenv("HOST", "0.0.0.0")
+    PORT = int(os.getenv("PORT", "8000"))
+    WORKERS = int(os.getenv("WEB_CONCURRENCY", str(os.cpu_count() or 1)))
+    WORKER_MAX_REQUESTS = int(os.getenv("WORKER_MAX_REQUESTS", "10000"))  # 0 disables recycling
+    WORKER_MAX_REQUESTS_JITTER = 1000  # Spreads recycling so workers do not restart together
+    WORKER_GRACEFUL_TIMEOUT = 30.0  # seconds to finish in-flight requests on shutdown
+    
+    # Prompt assembly: estimated input tokens for template + history + context + question
+    PROMPT_MAX_INPUT_TOKENS = int(os.getenv("PROMPT_MAX_INPUT_TOKENS", "1200"))
+    PROMPT_CONTEXT_SHARE = 0.6  # Share of the free budget reserved for context when trimming
+    PROMPT_MIN_CHUNK_TOKENS = 48  # Smaller remainders drop the chunk instead of truncating it
     
     # Memory settings
     MAX_CONVERSATION_HISTORY = 12
     CONTEXT_HISTORY_LIMIT = 6
+    MAX_SESSIONS = int(os.getenv("MAX_SESSIONS", "10000"))  # Least recently used sessions are evicted
+    SESSION_IDLE_TTL = float(os.getenv("SESSION_IDLE_TTL", "3600"))  # seconds
+    SESSION_SWEEP_INTERVAL = 60.0  # seconds between idle-session sweeps
     
-    # Chunk settings
-    CHUNK_SIZE = 1000
-    CHUNK_OVERLAP = 200
\ No newline at end of file
+    # Conversation compaction: fold older turns into a running summary stored with the session
+    CONVERSATION_COMPACTION = os.getenv("CONVERSATION_COMPACTION", "false").lower() == "true"
+    SUMMARY_TRIGGER_MESSAGES = 8  # History length that triggers a summarization pass
+    SUMMARY_KEEP_RECENT = 4  # Most recent messages kept verbatim after compaction
+    SUMMARY_MAX_TOKENS = 120
+    SUMMARY_INTERVAL = 1.0  # seconds between background summarization batches
+    SUMMARY_BATCH_SIZE = 16  # Sessions summarized concurrently per batch
+    
+    # Session backend: "memory" (single worker) or "sqlite" (shared by all workers; serve.py
+    # defaults to it when forking several workers)
+    SESSION_BACKEND = os.getenv("SESSION_BACKEND", "memory")
+    SESSION_DB_PATH = os.getenv("SESSION_DB_PATH", "./sessions.db")
+    SESSION_CACHE_SIZE = 1024  # Recently read histories kept per worker
+    SESSION_FLUSH_INTERVAL = 0.05  # seconds between batched writes
+    SESSION_FLUSH_BATCH_SIZE = 64  # pending messages that trigger an early flush
+    SESSION_STATS_INTERVAL = 10.0  # seconds between session/message count refreshes (never per scrape)
+    
+    # Chunk settings, in tokens as estimated by prompt.estimate_tokens (~4 characters each)
+    CHUNK_TOKENS = 250
+    CHUNK_OVERLAP_TOKENS = 50
+
+class SearchBatchRequest(BaseModel):
+    queries: List[str]
+    n_results: int = Field(5, ge=1, le=Config.MAX_RESULTS)  # Out-of-range values get a 422
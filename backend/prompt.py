@@ -0,0 +1,149 @@
+# prompt.py - Token-budgeted prompt assembly around a precompiled static template
+import re
+from typing import List, NamedTuple, Sequence, Tuple, Union
+
+# Words and single punctuation marks, roughly how BPE tokenizers split English text
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+
+def estimate_tokens(text: str) -> int:
+    """Approximate token count without a tokenizer: one per word or symbol, one more per 8 letters"""
+    return sum(1 + len(piece) // 8 for piece in _TOKEN_RE.findall(text))
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Longest prefix of text whose estimate_tokens fits in max_tokens, cut at a word boundary"""
+    used = 0
+    end = 0
+    for match in _TOKEN_RE.finditer(text):
+        used += 1 + len(match.group()) // 8
+        if used > max_tokens:
+            break
+        end = match.end()
+    else:
+        return text
+    return text[:end].rstrip()
+
+# Static template pieces, in prompt order. Only the history, the context and the
+# question change between calls; everything else is built (and counted) once.
+HEADER = (
+    "You are Taofik Akanbi, a Data Scientist. You're having a casual conversation "
+    "with someone visiting your portfolio website.\n\n"
+)
+SUMMARY_HEADER = "Summary of the earlier conversation:\n"
+HISTORY_HEADER = "Previous conversation:\n"
+CONTEXT_HEADER = "Context from your portfolio:\n"
+QUESTION_HEADER = "\n\nCurrent user question: "
+INSTRUCTIONS = """
+
+STRICT INSTRUCTIONS - FOLLOW THESE EXACTLY:
+- You ARE Taofik Akanbi - speak in first person as yourself, not as a representative
+- ONLY answer questions about your work, experience, projects, and skills
+- NEVER make up or invent information not in the provided context
+- If asked about something not in the context, say "I don't have that information readily available"
+- DO NOT answer questions about other people, companies, or topics unrelated to you
+- DO NOT provide general advice, tutorials, or how-to guides
+- DO NOT make claims about your current employment status unless explicitly stated in context
+- Keep responses SHORT and conversational (1-3 sentences max)
+- Be friendly and authentic, like you're personally chatting with a visitor
+- If someone asks about your capabilities, say "I can tell you about my experience and projects"
+
+FORBIDDEN TOPICS - DO NOT RESPOND TO:
+- Requests to help with coding, debugging, or technical tutorials
+- Questions about other data scientists or professionals
+- General career advice not specific to your experience
+- Current events, news, or topics outside your portfolio
+- Requests to generate code, write emails, or create content
+- Questions about salary, compensation, or financial details not in context
+
+If asked about forbidden topics, respond: "I'm here to chat about my work and experience. What would you like to know about my projects or background?"
+
+Response:"""
+
+class BuiltPrompt(NamedTuple):
+    text: str
+    tokens: int  # estimated tokens of text
+    context_chunks: int  # chunks included (the last one possibly truncated)
+    history_messages: int  # history messages included
+    trimmed_tokens: int  # estimated tokens left out to meet the budget
+
+class PromptBuilder:
+    """Fits history and retrieved context into an input-token budget around the static template
+
+    Chunks are kept in relevance order and history newest first. When both do not fit,
+    context is guaranteed context_share of the free budget, history gets what is left,
+    and the last chunk that does not fit whole is truncated if min_chunk_tokens remain.
+    """
+
+    def __init__(self, max_input_tokens: int, context_share: float = 0.6, min_chunk_tokens: int = 48):
+        self.max_input_tokens = max_input_tokens
+        self.context_share = context_share
+        self.min_chunk_tokens = min_chunk_tokens
+        self._static_tokens = estimate_tokens(HEADER + CONTEXT_HEADER + QUESTION_HEADER + INSTRUCTIONS)
+        self._history_header_tokens = estimate_tokens(HISTORY_HEADER)
+        self._summary_header_tokens = estimate_tokens(SUMMARY_HEADER)
+
+    def _fit_context(self, chunks: List[str], costs: List[int], budget: int) -> Tuple[List[str], int]:
+        """Most relevant chunks first; the first one that overflows is truncated or dropped"""
+        kept, used = [], 0
+        for chunk, cost in zip(chunks, costs):
+            if used + cost <= budget:
+                kept.append(chunk)
+                used += cost
+                continue
+            if budget - used >= self.min_chunk_tokens:
+                kept.append(truncate_to_tokens(chunk, budget - used))
+                used += estimate_tokens(kept[-1])
+            break
+        return kept, used
+
+    def _fit_history(self, history: List[str], costs: List[int], budget: int) -> Tuple[List[str], int]:
+        """Newest messages first, whole messages only, returned in chronological order"""
+        used, kept = self._history_header_tokens, 0
+        for cost in reversed(costs):
+            if used + cost > budget:
+                break
+            used += cost
+            kept += 1
+        if not kept:
+            return [], 0
+        return history[len(history) - kept:], used
+
+    def build(self, query: str, context: Union[str, Sequence[str]], history: Sequence[str],
+              history_limit: int, summary: str = "") -> BuiltPrompt:
+        """Assemble the prompt for query from context chunks (most relevant first) and history
+
+        A running summary of older turns, if any, is always kept; it is short by construction.
+        """
+        chunks = [context] if isinstance(context, str) else [chunk for chunk in context if chunk]
+        history = list(history[-history_limit:]) if history and history_limit > 0 else []
+
+        chunk_costs = [estimate_tokens(chunk) for chunk in chunks]
+        history_costs = [estimate_tokens(message) for message in history]
+        context_cost = sum(chunk_costs)
+        history_cost = sum(history_costs) + (self._history_header_tokens if history else 0)
+
+        fixed = self._static_tokens + estimate_tokens(query)
+        if summary:
+            fixed += self._summary_header_tokens + estimate_tokens(summary)
+        free = self.max_input_tokens - fixed
+        if context_cost + history_cost <= free:
+            kept_chunks, context_used = chunks, context_cost
+            kept_history, history_used = history, history_cost
+        else:
+            context_budget = max(free - history_cost, int(free * self.context_share))
+            kept_chunks, context_used = self._fit_context(chunks, chunk_costs, context_budget)
+            kept_history, history_used = self._fit_history(history, history_costs, free - context_used)
+
+        parts = [HEADER]
+        if summary:
+            parts += [SUMMARY_HEADER, summary, "\n\n"]
+        if kept_history:
+            parts += [HISTORY_HEADER, "\n".join(kept_history), "\n\n"]
+        parts += [CONTEXT_HEADER, "\n\n".join(kept_chunks), QUESTION_HEADER, query, INSTRUCTIONS]
+        tokens = fixed + context_used + history_used
+        return BuiltPrompt(
+            text="".join(parts),
+            tokens=tokens,
+            context_chunks=len(kept_chunks),
+            history_messages=len(kept_history),
+            trimmed_tokens=context_cost + history_cost - context_used - history_used
+        )
@@ -1,53 +1,199 @@
-# rag_service.py - Lightweight RAG with TF-IDF embeddings
+# rag_service.py - Lightweight RAG with TF-IDF (optionally hybrid dense) embeddings
+import asyncio
 import logging
-from typing import List, Dict, Any
-import chromadb
-import together
-import numpy as np
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-import pickle
+from array import array
+from typing import List, Dict, Any, Optional, AsyncIterator, Callable, Sequence, Tuple, Union, TYPE_CHECKING
 import os
+import hashlib
+import json
+import threading
+import time
 from models import Config
+from llm_client import AsyncLLMClient
+from cache import LRUCache, normalize_query
+from session_store import create_session_store
+from singleflight import SingleFlight
+from admission import AdmissionController, Overloaded
+from metrics import MetricsRegistry, SIZE_BUCKETS
+from health import LLMProber
+from prompt import PromptBuilder
+from summarizer import ConversationSummarizer
+
+# Heavy dependencies (sklearn, scipy, chromadb, together, embedding models) are imported inside the
+# methods that use them, so the API process can answer liveness probes right away
+if TYPE_CHECKING:
+    import numpy as np
+    from embeddings import EmbeddingBackend
+    from retrieval import DenseIndex, SparseRetrievalEngine
+    from vector_index import ChromaVectorIndex
 
 logger = logging.getLogger(__name__)
 
+FALLBACK_RESPONSE = "I apologize, but I'm having trouble generating a response right now."
+
 class RAGService:
     """Handles all RAG-related operations with lightweight TF-IDF embeddings"""
     
     def __init__(self):
         self.vectorizer = None
         self.document_vectors = None
+        self.retrieval_engine = None  # Inverted index over document_vectors
+        self.embedding_backend: Optional["EmbeddingBackend"] = None  # Set unless EMBEDDING_MODEL is "tfidf"
+        self.dense_index: Optional["DenseIndex"] = None  # Quantized chunk embeddings for hybrid scoring
+        self.vector_index: Optional["ChromaVectorIndex"] = None  # ANN over dense_index when VECTOR_INDEX is "hnsw"
         self.documents = []  # Store documents for retrieval
         self.document_metadata = []  # Store metadata
         self.chroma_client = None
         self.collection = None
-        self.conversations = {}  # Store conversations in memory
+        # Conversation memory (in-process by default, or shared SQLite across workers)
+        self.conversations = create_session_store()
+        
+        # Readiness: "loading" until the index is available, then "ready" or "failed"
+        self.status = "loading"
+        self.ready = threading.Event()
+        self.startup_error = None
+        self.startup_timings = {}  # Seconds spent in each startup phase
+        self.ingestion_stats = {}  # Throughput of the last index build
+        
+        self.llm_client = AsyncLLMClient()  # Pooled client for the async path
+        self.llm_prober = LLMProber(
+            self.llm_client,
+            Config.LLM_PROBE_INTERVAL,
+            Config.LLM_PROBE_TIMEOUT,
+            Config.LLM_PROBE_STALE_AFTER
+        )
+        
+        # Answer cache for repeated questions; cleared whenever the index changes
+        self.response_cache = LRUCache(Config.RESPONSE_CACHE_SIZE, ttl=Config.RESPONSE_CACHE_TTL)
+        
+        # Memoized query vectors and top-k results, keyed on the normalized query
+        self.query_vector_cache = LRUCache(Config.QUERY_CACHE_SIZE)
+        self.retrieval_cache = LRUCache(Config.QUERY_CACHE_SIZE)
+        self.query_embedding_cache = LRUCache(Config.QUERY_CACHE_SIZE)  # Depends on the model only
+        
+        # Coalesces identical in-flight generations (same key as the response cache)
+        self.single_flight = SingleFlight()
+        
+        # Bounds concurrent LLM calls on the async path; queued requests wait a bounded time
+        self.admission = AdmissionController(
+            Config.LLM_MAX_CONCURRENCY,
+            Config.LLM_MAX_QUEUE,
+            Config.LLM_MAX_QUEUE_WAIT,
+            Config.DEGRADE_QUEUE_DEPTH,
+            Config.OVERLOAD_RETRY_AFTER
+        )
+        
+        # Static prompt template compiled once; history and context fit a token budget
+        self.prompt_builder = PromptBuilder(
+            Config.PROMPT_MAX_INPUT_TOKENS,
+            Config.PROMPT_CONTEXT_SHARE,
+            Config.PROMPT_MIN_CHUNK_TOKENS
+        )
         
-        # Initialize Together AI
-        together.api_key = Config.TOGETHER_API_KEY
+        # Optional compaction of long sessions into running summaries (runs off the request path)
+        self.summarizer = None
+        if Config.CONVERSATION_COMPACTION:
+            self.summarizer = ConversationSummarizer(
+                self.conversations,
+                self._complete_summary,
+                Config.SUMMARY_TRIGGER_MESSAGES,
+                Config.SUMMARY_KEEP_RECENT,
+                Config.SUMMARY_INTERVAL,
+                Config.SUMMARY_BATCH_SIZE
+            )
+        
+        # Prometheus metrics for /metrics; every update on the request path is O(1)
+        self.metrics = MetricsRegistry(prefix="rag_")
+        self._register_metrics()
+    
+    def _register_metrics(self):
+        """Create the request-path histograms/counters and scrape-time views of existing counters"""
+        m = self.metrics
+        self.retrieval_seconds = m.histogram("retrieval_seconds", "Time to retrieve context chunks for one query")
+        self.prompt_chars = m.histogram("prompt_chars", "Size of prompts sent to the LLM in characters", SIZE_BUCKETS)
+        self.prompt_tokens = m.histogram("prompt_tokens", "Estimated size of prompts sent to the LLM in tokens",
+                                         [bucket // 4 for bucket in SIZE_BUCKETS])
+        self.llm_seconds = m.histogram("llm_request_seconds", "LLM completion latency (full stream for streaming)")
+        self.llm_errors = m.counter("llm_errors_total", "LLM calls that failed or returned an unexpected payload")
+        self.fallbacks = m.counter("fallback_responses_total", "Replies that used the fallback apology")
+        
+        # Existing counters are read at scrape time instead of being double-counted
+        for name, cache in (("response", self.response_cache),
+                            ("retrieval", self.retrieval_cache),
+                            ("query_vector", self.query_vector_cache),
+                            ("query_embedding", self.query_embedding_cache)):
+            m.counter_func("cache_hits_total", "Cache hits", lambda c=cache: c.hits, {"cache": name})
+            m.counter_func("cache_misses_total", "Cache misses", lambda c=cache: c.misses, {"cache": name})
+            m.gauge("cache_entries", "Entries held in each cache", lambda c=cache: len(c), {"cache": name})
+        m.counter_func("single_flight_coalesced_total", "Generations served by joining an identical in-flight call",
+                       lambda: self.single_flight.coalesced)
+        m.gauge("llm_active", "LLM calls holding an admission slot", lambda: self.admission.active)
+        m.gauge("llm_queue_depth", "Requests waiting for an LLM slot", lambda: self.admission.waiting)
+        m.counter_func("llm_rejected_total", "Requests rejected by admission control",
+                       lambda: self.admission.rejected_queue_full, {"reason": "queue_full"})
+        m.counter_func("llm_rejected_total", "Requests rejected by admission control",
+                       lambda: self.admission.rejected_timeout, {"reason": "timeout"})
+        m.gauge("sessions_active", "Conversations held by the session store",
+                lambda: self.conversations.stats()["active_sessions"])
+        m.gauge("session_messages", "Messages held by the session store",
+                lambda: self.conversations.stats()["total_messages"])
+        m.gauge("indexed_documents", "Chunks in the retrieval index", lambda: len(self.documents))
+        m.gauge("ready", "1 once the index is loaded", lambda: int(self.ready.is_set()))
+        if self.summarizer is not None:
+            m.counter_func("conversation_compactions_total", "Sessions folded into a running summary",
+                           lambda: self.summarizer.compactions)
+            m.gauge("conversation_compactions_pending", "Sessions waiting for a summarization pass",
+                    lambda: self.summarizer.stats()["pending"])
+        m.gauge("llm_probe_up", "1 if the last LLM probe succeeded and is not stale",
+                lambda: int(self.llm_prober.status == "connected"))
+        m.gauge("llm_probe_latency_seconds", "Latency of the last successful LLM probe",
+                lambda: self.llm_prober.latency or 0.0)
+        m.gauge("llm_probe_last_success_timestamp_seconds", "Unix time of the last successful LLM probe",
+                lambda: self.llm_prober.last_success or 0.0)
     
-    def initialize_embedding_model(self):
-        """Initialize the TF-IDF vectorizer"""
+    def initialize_embedding_model(self, dense: bool = True):
+        """Initialize the TF-IDF vectorizer and, if configured (and dense), the dense embedding model"""
         try:
-            # Initialize TF-IDF vectorizer with optimized parameters
-            self.vectorizer = TfidfVectorizer(
-                max_features=1000,  # Limit vocabulary size
-                stop_words='english',
-                ngram_range=(1, 2),  # Unigrams and bigrams
-                max_df=0.8,  # Ignore terms that appear in >80% of docs
-                min_df=2,    # Ignore terms that appear in <2 docs
-                lowercase=True,
-                strip_accents='ascii'
-            )
-            logger.info("TF-IDF vectorizer initialized successfully")
+            self.vectorizer = self._create_vectorizer()
+            logger.info(f"TF-IDF vectorizer ({Config.VECTORIZER}) initialized successfully")
+            
+            if dense and Config.EMBEDDING_MODEL != 'tfidf':
+                from embeddings import create_embedding_backend
+                self.embedding_backend = create_embedding_backend(Config.EMBEDDING_MODEL)
+                logger.info(f"Dense embedding model {Config.EMBEDDING_MODEL} initialized for hybrid retrieval")
         except Exception as e:
-            logger.error(f"Failed to initialize TF-IDF vectorizer: {e}")
+            logger.error(f"Failed to initialize embedding model: {e}")
             raise
     
+    def _create_vectorizer(self):
+        """Return an unfitted vectorizer of the configured kind (Config.VECTORIZER)"""
+        params = dict(
+            stop_words='english',
+            ngram_range=(1, 2),  # Unigrams and bigrams
+            max_df=0.8,  # Ignore terms that appear in >80% of docs
+            min_df=2,    # Ignore terms that appear in <2 docs
+            lowercase=True,
+            strip_accents='ascii'
+        )
+        if Config.VECTORIZER == 'hashing':
+            from vectorizer import HashingTfidfVectorizer
+            
+            # Hashed features: no vocabulary to build or hold, partitions vectorized in parallel
+            return HashingTfidfVectorizer(n_features=Config.HASHING_FEATURES, **params)
+        
+        from sklearn.feature_extraction.text import TfidfVectorizer
+        
+        # Initialize TF-IDF vectorizer with optimized parameters
+        return TfidfVectorizer(
+            max_features=1000,  # Limit vocabulary size
+            **params
+        )
+    
     def initialize_chromadb(self):
         """Initialize ChromaDB for metadata storage (vectors stored separately)"""
         try:
+            import chromadb
+            
             # Initialize ChromaDB with persistent storage
             self.chroma_client = chromadb.PersistentClient(path=Config.CHROMA_DB_PATH)
             
@@ -56,9 +202,14 @@ class RAGService:
                 self.collection = self.chroma_client.get_collection(Config.COLLECTION_NAME)
                 logger.info(f"Loaded existing collection: {Config.COLLECTION_NAME}")
             except:
+                from vector_index import hnsw_configuration
                 self.collection = self.chroma_client.create_collection(
                     name=Config.COLLECTION_NAME,
-                    metadata={"description": "Taofik Akanbi Portfolio Knowledge Base"}
+                    configuration=hnsw_configuration(
+                        Config.HNSW_EF_CONSTRUCTION, Config.HNSW_MAX_NEIGHBORS, Config.HNSW_EF_SEARCH
+                    ),
+                    metadata={"description": "Taofik Akanbi Portfolio Knowledge Base"},
+                    embedding_function=None
                 )
                 logger.info(f"Created new collection: {Config.COLLECTION_NAME}")
                 
@@ -68,304 +219,832 @@ class RAGService:
     
     def chunk_text(self, text: str) -> List[str]:
         """Split text into overlapping chunks"""
-        if len(text) <= Config.CHUNK_SIZE:
-            return [text]
-        
-        chunks = []
-        start = 0
-        
-        while start < len(text):
-            end = start + Config.CHUNK_SIZE
-            chunk = text[start:end]
-            
-            # Try to break at sentence boundaries
-            if end < len(text):
-                last_period = chunk.rfind('.')
-                last_newline = chunk.rfind('\n')
-                break_point = max(last_period, last_newline)
-                
-                if break_point > start + Config.CHUNK_SIZE // 2:
-                    chunk = text[start:break_point + 1]
-                    end = break_point + 1
-            
-            chunks.append(chunk.strip())
-            start = end - Config.CHUNK_OVERLAP
-            
-            if start >= len(text):
-                break
-        
-        return chunks
+        from ingestion import chunk_text
+        return chunk_text(text, Config.CHUNK_TOKENS, Config.CHUNK_OVERLAP_TOKENS)
     
-    def save_vectors(self):
-        """Save TF-IDF vectors to disk"""
+    def _index_dir(self) -> str:
+        return os.path.join(Config.CHROMA_DB_PATH, Config.INDEX_DIR)
+    
+    def save_vectors(self) -> bool:
+        """Save the index to disk in the memory-mapped format"""
         try:
-            vectors_path = os.path.join(Config.CHROMA_DB_PATH, "tfidf_vectors.pkl")
-            vectorizer_path = os.path.join(Config.CHROMA_DB_PATH, "tfidf_vectorizer.pkl")
-            docs_path = os.path.join(Config.CHROMA_DB_PATH, "documents.pkl")
+            from index_store import save_index
             
             os.makedirs(Config.CHROMA_DB_PATH, exist_ok=True)
-            
-            with open(vectors_path, 'wb') as f:
-                pickle.dump(self.document_vectors, f)
-            
-            with open(vectorizer_path, 'wb') as f:
-                pickle.dump(self.vectorizer, f)
-                
-            with open(docs_path, 'wb') as f:
-                pickle.dump({
-                    'documents': self.documents,
-                    'metadata': self.document_metadata
-                }, f)
-                
+            save_index(
+                self._index_dir(),
+                self.retrieval_engine.term_documents,
+                self.vectorizer,
+                self.documents,
+                self.document_metadata,
+                dense=self.dense_index,
+                dense_model=Config.EMBEDDING_MODEL if self.dense_index is not None else None
+            )
             logger.info("TF-IDF vectors and documents saved successfully")
+            return True
         except Exception as e:
             logger.error(f"Failed to save vectors: {e}")
+            return False
     
     def load_vectors(self):
-        """Load TF-IDF vectors from disk"""
+        """Memory-map the index from disk"""
         try:
-            vectors_path = os.path.join(Config.CHROMA_DB_PATH, "tfidf_vectors.pkl")
-            vectorizer_path = os.path.join(Config.CHROMA_DB_PATH, "tfidf_vectorizer.pkl")
-            docs_path = os.path.join(Config.CHROMA_DB_PATH, "documents.pkl")
+            from index_store import load_index, index_exists
+            from retrieval import SparseRetrievalEngine
             
-            if all(os.path.exists(p) for p in [vectors_path, vectorizer_path, docs_path]):
-                with open(vectors_path, 'rb') as f:
-                    self.document_vectors = pickle.load(f)
-                
-                with open(vectorizer_path, 'rb') as f:
-                    self.vectorizer = pickle.load(f)
-                    
-                with open(docs_path, 'rb') as f:
-                    data = pickle.load(f)
-                    self.documents = data['documents']
-                    self.document_metadata = data['metadata']
-                
-                logger.info(f"Loaded {len(self.documents)} documents from disk")
-                return True
-            return False
+            if not index_exists(self._index_dir()):
+                return False
+            
+            index = load_index(self._index_dir())
+            self.vectorizer = index['vectorizer']
+            self.documents = index['documents']
+            self.document_metadata = index['metadata']
+            # Document rows as a zero-copy transpose of the mapped posting lists
+            self.document_vectors = index['term_documents'].T
+            # Embeddings from another model are useless for this one's queries
+            self.dense_index = index['dense'] if index['dense_model'] == Config.EMBEDDING_MODEL else None
+            
+            self._on_index_changed(SparseRetrievalEngine.from_postings(index['term_documents']))
+            logger.info(f"Loaded {len(self.documents)} documents from disk")
+            return True
         except Exception as e:
             logger.error(f"Failed to load vectors: {e}")
             return False
     
+    def _on_index_changed(self, retrieval_engine: Optional["SparseRetrievalEngine"] = None):
+        """Swap in the retrieval engine and invalidate everything derived from the previous index"""
+        from retrieval import ShardedRetrievalEngine, SparseRetrievalEngine
+        
+        self.retrieval_engine = retrieval_engine or SparseRetrievalEngine(self.document_vectors)
+        if Config.RETRIEVAL_SHARDS > 1:
+            self.retrieval_engine = ShardedRetrievalEngine.from_engine(
+                self.retrieval_engine, Config.RETRIEVAL_SHARDS, Config.SHARD_MIN_POSTINGS
+            )
+        if self.dense_index is not None and self.dense_index.n_documents != self.retrieval_engine.n_documents:
+            logger.warning("Dense index does not match the document set, using TF-IDF only")
+            self.dense_index = None
+        self.vector_index = None  # Rebuilt from the new dense index by build_vector_index
+        self.response_cache.clear()
+        self.query_vector_cache.clear()
+        self.retrieval_cache.clear()
+    
+    def parse_sections(self, portfolio_text: str) -> List[Dict[str, str]]:
+        """Split the portfolio text into sections based on ## headers"""
+        from ingestion import iter_sections
+        return list(iter_sections(portfolio_text.split('\n')))
+    
+    def _manifest_path(self) -> str:
+        return os.path.join(Config.CHROMA_DB_PATH, Config.INDEX_MANIFEST_FILE)
+    
+    def load_manifest(self) -> Optional[Dict[str, Any]]:
+        """Load the index manifest (content hashes the saved index was built from)"""
+        try:
+            with open(self._manifest_path(), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.error(f"Failed to load index manifest: {e}")
+            return None
+    
+    def save_manifest(self, data_hash: str, sections: List[Dict[str, str]]):
+        """Record the content hashes the current index was built from"""
+        manifest = {
+            'data_hash': data_hash,
+            'chunk_tokens': Config.CHUNK_TOKENS,
+            'chunk_overlap_tokens': Config.CHUNK_OVERLAP_TOKENS,
+            'vectorizer': Config.VECTORIZER,
+            'embedding_model': Config.EMBEDDING_MODEL,
+            'embedding_dtype': Config.EMBEDDING_DTYPE,
+            'sections': [
+                {'title': section['title'], 'hash': section['hash']}
+                for section in sections
+            ]
+        }
+        try:
+            tmp_path = self._manifest_path() + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(manifest, f, indent=2)
+            os.replace(tmp_path, self._manifest_path())
+        except Exception as e:
+            logger.error(f"Failed to save index manifest: {e}")
+    
+    def _reusable_chunks(self, manifest: Optional[Dict[str, Any]]) -> Dict[str, range]:
+        """Map section hash -> positions of its chunks in the previous index, for sections that can be reused"""
+        if not manifest or manifest.get('chunk_tokens') != Config.CHUNK_TOKENS \
+                or manifest.get('chunk_overlap_tokens') != Config.CHUNK_OVERLAP_TOKENS:
+            return {}
+        if not self.load_vectors():
+            return {}
+        import numpy as np
+        
+        # Chunks of a section are stored contiguously, in section order
+        section_index = np.asarray([metadata['section_index'] for metadata in self.document_metadata])
+        bounds = np.searchsorted(section_index, np.arange(len(manifest['sections']) + 1))
+        return {
+            section['hash']: range(bounds[i], bounds[i + 1])
+            for i, section in enumerate(manifest['sections'])
+            if bounds[i] < bounds[i + 1]
+        }
+    
     def load_portfolio_data(self):
-        """Load and process the portfolio data"""
+        """Stream the knowledge base into the index, rebuilding it only if a source changed
+        
+        Sources (Config.DATA_SOURCES files, directories or globs) are read line by line
+        and split into sections and chunk spans on the fly; section texts are spooled to
+        disk while the vectorizer consumes the chunks, so memory does not grow with the
+        input size.
+        """
+        from ingestion import DocumentWriter, IngestionProgress, resolve_sources, hash_sources, \
+            chunk_spans, hashing_fit_transform, stream_partitions, stream_sections, stream_spans
+        from index_store import MetadataTable, has_legacy_pickles
+        import numpy as np
+        
         try:
-            # Try to load existing vectors first
-            if self.load_vectors():
+            sources = resolve_sources(Config.DATA_SOURCES, Config.DATA_EXTENSIONS)
+            data_hash = hash_sources(sources)
+            
+            # Reuse existing vectors only if they were built from these exact sources and embedding setup
+            manifest = self.load_manifest()
+            same_embeddings = manifest is not None \
+                and manifest.get('vectorizer', 'tfidf') == Config.VECTORIZER \
+                and manifest.get('embedding_model', 'tfidf') == Config.EMBEDDING_MODEL \
+                and manifest.get('embedding_dtype', Config.EMBEDDING_DTYPE) == Config.EMBEDDING_DTYPE
+            if manifest and manifest.get('data_hash') == data_hash and same_embeddings and self.load_vectors():
                 logger.info("Using existing TF-IDF vectors")
                 return
             
-            # Read the portfolio data file
-            with open(Config.DATA_FILE, "r", encoding="utf-8") as file:
-                portfolio_text = file.read()
-            
-            # Split into sections based on headers
-            sections = []
-            current_section = ""
-            current_title = ""
-            
-            lines = portfolio_text.split('\n')
-            
-            for line in lines:
-                if line.startswith('##') and not line.startswith('###'):
-                    # Save previous section
-                    if current_section.strip():
-                        sections.append({
-                            'title': current_title,
-                            'content': current_section.strip()
-                        })
-                    
-                    # Start new section
-                    current_title = line.replace('##', '').strip()
-                    current_section = line + '\n'
+            if manifest:
+                logger.info("Knowledge base changed since the index was built, refreshing index")
+            elif has_legacy_pickles(Config.CHROMA_DB_PATH):
+                # Nothing records which sources (or chunking) the pickles were built from
+                logger.info(f"Ignoring the legacy pickled index in {Config.CHROMA_DB_PATH}, rebuilding")
+            
+            # Only re-chunk sections whose content changed; the rest keep their previous spans.
+            # Loading the previous index restores its fitted vectorizer, so start from a fresh one.
+            reusable_chunks = self._reusable_chunks(manifest) if same_embeddings else {}
+            previous_documents = self.documents
+            self.vectorizer = self._create_vectorizer()
+            
+            # Embeddings of reused chunks are carried over from the previous dense index
+            previous_dense = self.dense_index if reusable_chunks else None
+            previous_rows = array('q')
+            
+            def reusable(section: Dict[str, str]):
+                positions = reusable_chunks.get(section['hash'])
+                return None if positions is None else previous_documents.spans(positions.start, positions.stop)
+            
+            def chunker(content: str):
+                return chunk_spans(content, Config.CHUNK_TOKENS, Config.CHUNK_OVERLAP_TOKENS)
+            
+            os.makedirs(Config.CHROMA_DB_PATH, exist_ok=True)
+            progress = IngestionProgress(sum(os.path.getsize(path) for path in sources), Config.INGEST_PROGRESS_INTERVAL)
+            writer = DocumentWriter(os.path.join(Config.CHROMA_DB_PATH, "documents.spool"))
+            sections: List[Dict[str, str]] = []
+            section_index = array('i')
+            chunk_index = array('i')
+            
+            def sink(section_number: int, encoded: bytes, spans):
+                writer.append(encoded, spans)
+                section_index.extend([section_number] * len(spans))
+                chunk_index.extend(range(len(spans)))
+                section = sections[section_number]
+                if section['reused']:
+                    previous_rows.extend(reusable_chunks[section['hash']])
                 else:
-                    current_section += line + '\n'
-            
-            # Add the last section
-            if current_section.strip():
-                sections.append({
-                    'title': current_title,
-                    'content': current_section.strip()
-                })
-            
-            # Process each section and create documents
-            self.documents = []
-            self.document_metadata = []
-            
-            for i, section in enumerate(sections):
-                # Create chunks from the section
-                chunks = self.chunk_text(section['content'])
-                
-                for j, chunk in enumerate(chunks):
-                    self.documents.append(chunk)
-                    self.document_metadata.append({
-                        'section_title': section['title'],
-                        'chunk_index': j,
-                        'section_index': i,
-                        'id': f"section_{i}_chunk_{j}"
-                    })
+                    previous_rows.extend([-1] * len(spans))
             
-            # Generate TF-IDF vectors
-            logger.info("Generating TF-IDF vectors for portfolio data...")
-            self.document_vectors = self.vectorizer.fit_transform(self.documents)
+            def documents():
+                # Chunk texts are decoded for the vectorizer only; the index keeps spans
+                for section_number, encoded, spans in stream_spans(stream_sections(sources, progress), chunker,
+                                                                   reusable, sections, progress):
+                    sink(section_number, encoded, spans)
+                    for start, end in spans:
+                        yield encoded[start:end].decode("utf-8")
             
-            # Save vectors to disk
-            self.save_vectors()
+            # Generate TF-IDF vectors (IDF weights depend on every chunk, so refit) in the same pass
+            logger.info(f"Generating TF-IDF vectors for {len(sources)} source file(s)...")
+            if Config.VECTORIZER == 'hashing':
+                self.document_vectors = hashing_fit_transform(
+                    stream_partitions(stream_sections(sources, progress), reusable, sections, Config.INGEST_PARTITION_BYTES),
+                    self.vectorizer,
+                    Config.CHUNK_TOKENS,
+                    Config.CHUNK_OVERLAP_TOKENS,
+                    Config.INGEST_WORKERS,
+                    sink,
+                    progress
+                )
+            else:
+                self.document_vectors = self.vectorizer.fit_transform(documents())
+            self.documents = writer.finish()
+            self.document_metadata = MetadataTable(
+                [section['title'] for section in sections],
+                np.frombuffer(section_index, dtype=np.int32),
+                np.frombuffer(chunk_index, dtype=np.int32)
+            )
+            self.dense_index = self._encode_documents(previous_dense, np.frombuffer(previous_rows, dtype=np.int64))
+            self._on_index_changed()
+            
+            # Save vectors to disk, then the manifest that marks them as fresh
+            if self.save_vectors():
+                self.save_manifest(data_hash, sections)
+                # Serve from the saved, memory-mapped index; this releases the spool mapping
+                if not self.load_vectors():
+                    raise RuntimeError("Saved index could not be reopened")
+                writer.remove()
+            else:
+                logger.warning(f"Index not saved, serving documents from the spool at {writer.path}")
             
-            logger.info(f"Successfully processed {len(self.documents)} document chunks")
+            progress.log()
+            self.ingestion_stats = progress.stats()
+            reused_sections = sum(section['reused'] for section in sections)
+            logger.info(
+                f"Successfully processed {len(self.documents)} document chunks "
+                f"({reused_sections}/{len(sections)} sections reused) "
+                f"in {self.ingestion_stats['seconds']:.3f}s"
+            )
             
         except Exception as e:
             logger.error(f"Failed to load portfolio data: {e}")
             raise
     
+    def _encode_documents(self, previous: Optional["DenseIndex"] = None,
+                          previous_rows: Optional["np.ndarray"] = None) -> Optional["DenseIndex"]:
+        """Embed the chunks with the dense model (batched, in parallel) and quantize the vectors
+        
+        previous_rows maps each chunk to its row in the previous dense index (-1 if new);
+        those rows are copied instead of re-encoded.
+        """
+        if self.embedding_backend is None:
+            return None
+        from embeddings import encode_documents
+        from index_store import DocumentSelection
+        from retrieval import DenseIndex
+        import numpy as np
+        
+        start_time = time.perf_counter()
+        reuse = previous is not None and previous_rows is not None and previous.dtype == Config.EMBEDDING_DTYPE \
+            and bool((previous_rows >= 0).any())
+        if not reuse:
+            embeddings = encode_documents(
+                self.embedding_backend,
+                self.documents,
+                Config.EMBEDDING_BATCH_SIZE,
+                Config.EMBEDDING_WORKERS
+            )
+            dense_index = DenseIndex.from_float(embeddings, Config.EMBEDDING_DTYPE)
+            reused = 0
+        else:
+            changed = np.flatnonzero(previous_rows < 0)
+            new_index = None
+            if len(changed):
+                embeddings = encode_documents(
+                    self.embedding_backend,
+                    DocumentSelection(self.documents, changed),
+                    Config.EMBEDDING_BATCH_SIZE,
+                    Config.EMBEDDING_WORKERS
+                )
+                new_index = DenseIndex.from_float(embeddings, Config.EMBEDDING_DTYPE)
+            dense_index = DenseIndex.merge(previous, previous_rows, new_index)
+            reused = len(previous_rows) - len(changed)
+        logger.info(
+            f"Built {Config.EMBEDDING_DTYPE} dense index ({dense_index.vectors.nbytes / 1e6:.1f} MB, "
+            f"{reused} embeddings reused) in {time.perf_counter() - start_time:.3f}s"
+        )
+        return dense_index
+    
+    def build_vector_index(self):
+        """Open the ANN index of the dense embeddings, (re)building the Chroma collection if it is stale"""
+        if self.dense_index is None:
+            logger.warning("VECTOR_INDEX=hnsw needs a dense EMBEDDING_MODEL, using exact search")
+            return
+        from vector_index import ChromaVectorIndex, hnsw_configuration
+        
+        vector_index = ChromaVectorIndex(
+            Config.CHROMA_DB_PATH,
+            Config.COLLECTION_NAME,
+            hnsw_configuration(Config.HNSW_EF_CONSTRUCTION, Config.HNSW_MAX_NEIGHBORS, Config.HNSW_EF_SEARCH),
+            Config.VECTOR_INDEX_BATCH_SIZE
+        )
+        manifest = self.load_manifest() or {}
+        fingerprint = f"{manifest.get('data_hash')}:{Config.EMBEDDING_MODEL}:{Config.EMBEDDING_DTYPE}"
+        try:
+            # Built from the saved index in another process; this one connects lazily
+            vector_index.sync(self._index_dir(), fingerprint)
+        except Exception as e:
+            logger.error(f"Failed to build HNSW vector index, using exact search: {e}")
+            return
+        self.vector_index = vector_index
+    
+    def vector_index_recall(self, queries: List[str], k: int = 10) -> float:
+        """Recall@k of the ANN index against exact search over the same embeddings"""
+        from vector_index import recall_at_k
+        embeddings = [self._embed_query(normalize_query(query)) for query in queries]
+        approximate = [ids for ids, _ in self.vector_index.search_batch(embeddings, k)]
+        exact = [self.dense_index.search(embedding, k)[0] for embedding in embeddings]
+        return recall_at_k(approximate, exact)
+    
+    def _embed_query(self, normalized_query: str):
+        """Dense query embedding, memoized per normalized query"""
+        embedding = self.query_embedding_cache.get(normalized_query)
+        if embedding is None:
+            from embeddings import l2_normalize
+            embedding = l2_normalize(self.embedding_backend.encode([normalized_query]))[0]
+            self.query_embedding_cache.set(normalized_query, embedding)
+        return embedding
+    
+    def _vectorize_query(self, normalized_query: str):
+        """Transform a query with the fitted vectorizer, memoized per normalized query"""
+        query_vector = self.query_vector_cache.get(normalized_query)
+        if query_vector is None:
+            query_vector = self.vectorizer.transform([normalized_query])
+            self.query_vector_cache.set(normalized_query, query_vector)
+        return query_vector
+    
+    def _format_results(self, top_indices, similarities) -> List[Dict[str, Any]]:
+        """Turn engine output into the search result format"""
+        formatted_results = []
+        for idx, similarity in zip(top_indices, similarities):
+            formatted_results.append({
+                'content': self.documents[idx],
+                'metadata': self.document_metadata[idx],
+                'similarity': float(similarity)
+            })
+        return formatted_results
+    
     def query_documents(self, query: str, n_results: int = 5) -> List[Dict[str, Any]]:
         """Query documents using TF-IDF similarity"""
+        start_time = time.perf_counter()
         try:
-            # Transform query using fitted vectorizer
-            query_vector = self.vectorizer.transform([query])
+            normalized_query = normalize_query(query)
+            cache_key = (normalized_query, n_results)
+            cached_results = self.retrieval_cache.get(cache_key)
+            if cached_results is not None:
+                return list(cached_results)
             
-            # Calculate cosine similarity
-            similarities = cosine_similarity(query_vector, self.document_vectors).flatten()
-            
-            # Get top results
-            top_indices = np.argsort(similarities)[::-1][:n_results]
+            # Transform query using fitted vectorizer
+            query_vector = self._vectorize_query(normalized_query)
             
-            # Format results
-            formatted_results = []
-            for idx in top_indices:
-                if similarities[idx] > 0:  # Only include relevant results
-                    formatted_results.append({
-                        'content': self.documents[idx],
-                        'metadata': self.document_metadata[idx],
-                        'similarity': float(similarities[idx])
-                    })
+            if self.vector_index is not None:
+                # Hybrid over the ANN neighbours and the sparse candidates only, so latency stays flat as the corpus grows
+                from retrieval import fuse_candidates
+                query_embedding = self._embed_query(normalized_query)
+                dense_candidates, _ = self.vector_index.search(query_embedding, n_results * Config.ANN_CANDIDATE_FACTOR)
+                candidates, sparse_scores = self.retrieval_engine.score(query_vector)
+                top_indices, similarities = fuse_candidates(
+                    self.dense_index,
+                    query_embedding,
+                    dense_candidates,
+                    candidates,
+                    sparse_scores,
+                    n_results,
+                    Config.HYBRID_DENSE_WEIGHT
+                )
+            elif self.dense_index is not None:
+                # Hybrid: dense cosine over every chunk fused with the sparse candidates' TF-IDF cosine
+                from retrieval import hybrid_search
+                candidates, sparse_scores = self.retrieval_engine.score(query_vector)
+                top_indices, similarities = hybrid_search(
+                    self.dense_index.scores(self._embed_query(normalized_query)),
+                    candidates,
+                    sparse_scores,
+                    n_results,
+                    Config.HYBRID_DENSE_WEIGHT
+                )
+            else:
+                # Score only documents sharing a term with the query, then take the top k
+                # (the engine already drops zero-similarity documents)
+                top_indices, similarities = self.retrieval_engine.search(query_vector, n_results)
+            formatted_results = self._format_results(top_indices, similarities)
             
-            return formatted_results
+            self.retrieval_cache.set(cache_key, formatted_results)
+            return list(formatted_results)
             
         except Exception as e:
             logger.error(f"Failed to query documents: {e}")
             return []
+        finally:
+            self.retrieval_seconds.observe(time.perf_counter() - start_time)
+    
+    def query_documents_batch(self, queries: List[str], n_results: int = 5) -> List[List[Dict[str, Any]]]:
+        """Query many documents at once: one transform and one sparse product for all cache misses"""
+        if self.dense_index is not None:
+            # Hybrid scoring is per query (the dense scores are a single mat-vec each)
+            return [self.query_documents(query, n_results) for query in queries]
+        try:
+            normalized_queries = [normalize_query(query) for query in queries]
+            results = [self.retrieval_cache.get((q, n_results)) for q in normalized_queries]
+            
+            # Deduplicate the misses so each distinct query is scored once
+            missing = list(dict.fromkeys(q for q, r in zip(normalized_queries, results) if r is None))
+            if missing:
+                query_vectors = self.vectorizer.transform(missing)
+                batch = self.retrieval_engine.search_batch(query_vectors, n_results)
+                scored = {}
+                for normalized_query, (top_indices, similarities) in zip(missing, batch):
+                    scored[normalized_query] = self._format_results(top_indices, similarities)
+                    self.retrieval_cache.set((normalized_query, n_results), scored[normalized_query])
+                results = [r if r is not None else scored[q] for q, r in zip(normalized_queries, results)]
+            
+            return [list(r) for r in results]
+            
+        except Exception as e:
+            logger.error(f"Failed to batch query documents: {e}")
+            return [[] for _ in queries]
     
     def query_chromadb(self, query: str, n_results: int = 5) -> List[Dict[str, Any]]:
         """Query documents (keeping same interface)"""
         return self.query_documents(query, n_results)
     
-    def generate_response_with_memory(self, query: str, context: str, conversation_history: List[str]) -> str:
+    def build_prompt(self, query: str, context: Union[str, Sequence[str]], conversation_history: List[str],
+                     summary: str = "") -> str:
+        """Build the LLM prompt from conversation summary + history + RAG context, within the input-token budget"""
+        prompt = self.prompt_builder.build(
+            query, context, conversation_history, Config.CONTEXT_HISTORY_LIMIT, summary
+        )
+        
+        logger.info(
+            f"Prompt: {prompt.tokens} tokens ({prompt.context_chunks} chunks, "
+            f"{prompt.history_messages} history messages, {prompt.trimmed_tokens} tokens trimmed)"
+        )
+        self.prompt_chars.observe(len(prompt.text))
+        self.prompt_tokens.observe(prompt.tokens)
+        return prompt.text
+    
+    def completion_params(self) -> Dict[str, Any]:
+        """Sampling parameters shared by every completion call"""
+        return {
+            "max_tokens": Config.MAX_TOKENS,
+            "temperature": Config.TEMPERATURE,
+            "top_p": Config.TOP_P,
+            "repetition_penalty": Config.REPETITION_PENALTY,
+            "stop": Config.STOP_SEQUENCES
+        }
+    
+    def extract_completion_text(self, response: Dict[str, Any]) -> str:
+        """Pull the generated text out of a completion response"""
+        # Handle different response formats
+        if 'output' in response:
+            if 'choices' in response['output']:
+                return response['output']['choices'][0]['text'].strip()
+            else:
+                return response['output']['text'].strip()
+        elif 'choices' in response:
+            return response['choices'][0]['text'].strip()
+        else:
+            logger.error(f"Unexpected response format: {response}")
+            self.llm_errors.inc()
+            return FALLBACK_RESPONSE
+    
+    def generate_response_with_memory(self, query: str, context: Union[str, Sequence[str]],
+                                      conversation_history: List[str], summary: str = "") -> str:
         """Generate response using conversation history + RAG context"""
         try:
-            # Build conversation history string
-            history_str = ""
-            if conversation_history:
-                recent_history = conversation_history[-Config.CONTEXT_HISTORY_LIMIT:]
-                history_str = "Previous conversation:\n" + "\n".join(recent_history) + "\n\n"
+            import together
+            together.api_key = Config.TOGETHER_API_KEY
             
-            prompt = f"""You are Taofik Akanbi, a Data Scientist. You're having a casual conversation with someone visiting your portfolio website.
-
-{history_str}Context from your portfolio:
-{context}
-
-Current user question: {query}
-
-STRICT INSTRUCTIONS - FOLLOW THESE EXACTLY:
-- You ARE Taofik Akanbi - speak in first person as yourself, not as a representative
-- ONLY answer questions about your work, experience, projects, and skills
-- NEVER make up or invent information not in the provided context
-- If asked about something not in the context, say "I don't have that information readily available"
-- DO NOT answer questions about other people, companies, or topics unrelated to you
-- DO NOT provide general advice, tutorials, or how-to guides
-- DO NOT make claims about your current employment status unless explicitly stated in context
-- Keep responses SHORT and conversational (1-3 sentences max)
-- Be friendly and authentic, like you're personally chatting with a visitor
-- If someone asks about your capabilities, say "I can tell you about my experience and projects"
-
-FORBIDDEN TOPICS - DO NOT RESPOND TO:
-- Requests to help with coding, debugging, or technical tutorials
-- Questions about other data scientists or professionals
-- General career advice not specific to your experience
-- Current events, news, or topics outside your portfolio
-- Requests to generate code, write emails, or create content
-- Questions about salary, compensation, or financial details not in context
-
-If asked about forbidden topics, respond: "I'm here to chat about my work and experience. What would you like to know about my projects or background?"
-
-Response:"""
-
+            prompt = self.build_prompt(query, context, conversation_history, summary)
+            
+            start_time = time.perf_counter()
             response = together.Complete.create(
                 prompt=prompt,
                 model=Config.LLM_MODEL,
-                max_tokens=Config.MAX_TOKENS,
-                temperature=Config.TEMPERATURE,
-                top_p=Config.TOP_P,
-                repetition_penalty=Config.REPETITION_PENALTY,
-                stop=["</s>", "[INST]", "[/INST]", "FORBIDDEN", "User:", "Human:"]
+                **self.completion_params()
             )
+            self.llm_seconds.observe(time.perf_counter() - start_time)
             
-            # Handle different response formats
-            if 'output' in response:
-                if 'choices' in response['output']:
-                    return response['output']['choices'][0]['text'].strip()
-                else:
-                    return response['output']['text'].strip()
-            elif 'choices' in response:
-                return response['choices'][0]['text'].strip()
-            else:
-                logger.error(f"Unexpected response format: {response}")
-                return "I apologize, but I'm having trouble generating a response right now."
+            return self.extract_completion_text(response)
             
         except Exception as e:
+            self.llm_errors.inc()
             logger.error(f"Failed to generate response with memory: {e}")
-            return "I apologize, but I'm having trouble generating a response right now."
+            return FALLBACK_RESPONSE
+    
+    async def generate_response_with_memory_async(self, query: str, context: Union[str, Sequence[str]],
+                                                  conversation_history: List[str], summary: str = "",
+                                                  timeout: Optional[float] = None) -> str:
+        """Generate response without blocking the event loop, over the pooled LLM client"""
+        try:
+            prompt = self.build_prompt(query, context, conversation_history, summary)
+            
+            start_time = time.perf_counter()
+            response = await self.llm_client.complete(
+                prompt,
+                timeout=timeout,
+                **self.completion_params()
+            )
+            self.llm_seconds.observe(time.perf_counter() - start_time)
+            
+            return self.extract_completion_text(response)
+            
+        except Exception as e:
+            self.llm_errors.inc()
+            logger.error(f"Failed to generate async response with memory: {e}")
+            return FALLBACK_RESPONSE
+    
+    async def _complete_summary(self, prompt: str) -> str:
+        """LLM call for background summarization; it yields to chat traffic when the queue backs up"""
+        if self.admission.degraded:
+            raise Overloaded("LLM queue is backed up", self.admission.retry_after)
+        async with self.admission.slot():
+            response = await self.llm_client.complete(
+                prompt,
+                max_tokens=Config.SUMMARY_MAX_TOKENS,
+                temperature=0.3,
+                stop=Config.STOP_SEQUENCES
+            )
+        summary = self.extract_completion_text(response)
+        if not summary or summary == FALLBACK_RESPONSE:
+            raise ValueError("LLM returned no summary")
+        return summary
+    
+    def _retrieve_documents(self, message: str, n_results: int = 3) -> List[Dict[str, Any]]:
+        """Query documents for relevant context"""
+        return self.query_documents(message, n_results=n_results)
+    
+    async def _request_budget(self, session_id: str) -> Tuple[str, List[str], int]:
+        """(summary, history, chunks to retrieve): history and chunks trimmed while the LLM queue is backed up"""
+        # The SQLite store reads from disk: keep it off the event loop
+        summary, history = await asyncio.to_thread(self.conversations.get_conversation, session_id)
+        if not self.admission.degraded:
+            return summary, history, 3
+        # Smaller prompts finish sooner and drain the queue faster
+        limit = Config.DEGRADED_CONTEXT_HISTORY_LIMIT
+        return summary, (history[-limit:] if limit > 0 else []), Config.DEGRADED_RETRIEVAL_RESULTS
+    
+    def _format_context(self, relevant_docs: List[Dict[str, Any]]) -> List[str]:
+        """Retrieved chunk texts, most relevant first, for the prompt builder"""
+        return [doc['content'] for doc in relevant_docs]
+    
+    def _retrieve_context(self, message: str) -> List[str]:
+        """Query documents and format them as prompt context"""
+        return self._format_context(self._retrieve_documents(message))
+    
+    def _store_exchange(self, session_id: str, message: str, response: str):
+        """Store conversation (keep last N exchanges for better context)"""
+        # The session ring buffer keeps only the last MAX_CONVERSATION_HISTORY messages
+        self.conversations.append(session_id, f"User: {message}", f"Assistant: {response}")
+        if response == FALLBACK_RESPONSE:
+            self.fallbacks.inc()  # Every chat path ends here exactly once
+        if self.summarizer is not None:
+            self.summarizer.schedule(session_id)
+    
+    def _response_cache_key(self, message: str, relevant_docs: List[Dict[str, Any]],
+                            conversation_history: List[str], summary: str = "") -> tuple:
+        """Cache key: normalized query + retrieved chunk ids + summary/recent history fingerprint"""
+        recent_history = conversation_history[-Config.CONTEXT_HISTORY_LIMIT:]
+        history_fingerprint = hashlib.sha1("\n".join([summary] + recent_history).encode("utf-8")).hexdigest()
+        chunk_ids = tuple(doc['metadata']['id'] for doc in relevant_docs)
+        return (normalize_query(message), chunk_ids, history_fingerprint)
+    
+    def _cache_response(self, cache_key: tuple, response: str):
+        """Remember a generated answer (fallback answers are never cached)"""
+        if response and response != FALLBACK_RESPONSE:
+            self.response_cache.set(cache_key, response)
     
     def process_chat_message(self, message: str, session_id: str) -> str:
         """Process a chat message with memory and RAG"""
-        # Initialize conversation history for new sessions
-        if session_id not in self.conversations:
-            self.conversations[session_id] = []
-        
-        # Query documents for relevant context
-        relevant_docs = self.query_documents(message, n_results=3)
-        context = "\n\n".join([doc['content'] for doc in relevant_docs])
-        
-        # Generate response with conversation history
-        response = self.generate_response_with_memory(
-            message, 
-            context, 
-            self.conversations[session_id]
-        )
+        # Empty history for new sessions
+        summary, history = self.conversations.get_conversation(session_id)
+        
+        relevant_docs = self._retrieve_documents(message)
+        cache_key = self._response_cache_key(message, relevant_docs, history, summary)
+        response = self.response_cache.get(cache_key)
+        
+        if response is None:
+            # Generate response with conversation history; identical concurrent
+            # questions share one LLM call
+            response = self.single_flight.do(cache_key, lambda: self.generate_response_with_memory(
+                message, 
+                self._format_context(relevant_docs), 
+                history,
+                summary
+            ))
+            self._cache_response(cache_key, response)
         
-        # Store conversation (keep last N exchanges for better context)
-        self.conversations[session_id].append(f"User: {message}")
-        self.conversations[session_id].append(f"Assistant: {response}")
+        self._store_exchange(session_id, message, response)
+        return response
+    
+    async def _generate_admitted(self, message: str, relevant_docs: List[Dict[str, Any]],
+                                 history: List[str], summary: str) -> str:
+        """Generate once an LLM slot is free; raises Overloaded if none frees up in time"""
+        async with self.admission.slot():
+            return await self.generate_response_with_memory_async(
+                message,
+                self._format_context(relevant_docs),
+                history,
+                summary
+            )
+    
+    async def process_chat_message_async(self, message: str, session_id: str) -> str:
+        """Process a chat message with memory and RAG without blocking the event loop"""
+        summary, history, n_results = await self._request_budget(session_id)
+        
+        # Scoring (and dense query encoding) is CPU-bound: keep it off the event loop
+        relevant_docs = await asyncio.to_thread(self._retrieve_documents, message, n_results)
+        cache_key = self._response_cache_key(message, relevant_docs, history, summary)
+        response = self.response_cache.get(cache_key)
         
-        # Keep only recent messages to prevent memory overflow
-        if len(self.conversations[session_id]) > Config.MAX_CONVERSATION_HISTORY:
-            self.conversations[session_id] = self.conversations[session_id][-Config.MAX_CONVERSATION_HISTORY:]
+        if response is None:
+            # Only the leader of a coalesced group takes an LLM slot
+            response = await self.single_flight.do_async(
+                cache_key, lambda: self._generate_admitted(message, relevant_docs, history, summary)
+            )
+            self._cache_response(cache_key, response)
         
+        self._store_exchange(session_id, message, response)
         return response
     
+    async def stream_chat_message(self, message: str, session_id: str) -> AsyncIterator[Dict[str, Any]]:
+        """Stream a chat reply as events: retrieval metadata first, then tokens, then done"""
+        summary, history, n_results = await self._request_budget(session_id)
+        
+        # Scoring (and dense query encoding) is CPU-bound: keep it off the event loop
+        relevant_docs = await asyncio.to_thread(self._retrieve_documents, message, n_results)
+        yield {
+            "event": "metadata",
+            "data": {
+                "session_id": session_id,
+                "sources": [
+                    {
+                        "id": doc['metadata']['id'],
+                        "section_title": doc['metadata']['section_title'],
+                        "similarity": doc['similarity']
+                    }
+                    for doc in relevant_docs
+                ]
+            }
+        }
+        
+        cache_key = self._response_cache_key(message, relevant_docs, history, summary)
+        cached = self.response_cache.get(cache_key)
+        parts = []
+        completed = False
+        try:
+            if cached is not None:
+                parts.append(cached)
+                yield {"event": "token", "data": {"text": cached}}
+            else:
+                prompt = self.build_prompt(message, self._format_context(relevant_docs), history, summary)
+                try:
+                    async with self.admission.slot():
+                        start_time = time.perf_counter()
+                        async for text in self.llm_client.stream_complete(prompt, **self.completion_params()):
+                            # Match the stripped output of the non-streaming path
+                            if not parts:
+                                text = text.lstrip()
+                                if not text:
+                                    continue
+                            parts.append(text)
+                            yield {"event": "token", "data": {"text": text}}
+                        self.llm_seconds.observe(time.perf_counter() - start_time)
+                    completed = True
+                except Overloaded as e:
+                    # Headers are already sent, so the overload is reported in-band
+                    logger.warning(f"Stream not admitted: {e.reason}")
+                    parts.append(FALLBACK_RESPONSE)
+                    yield {"event": "token", "data": {"text": FALLBACK_RESPONSE}}
+                except Exception as e:
+                    self.llm_errors.inc()
+                    logger.error(f"Failed to stream response with memory: {e}")
+                    if not parts:
+                        parts.append(FALLBACK_RESPONSE)
+                        yield {"event": "token", "data": {"text": FALLBACK_RESPONSE}}
+            
+            yield {"event": "done", "data": {"session_id": session_id}}
+        finally:
+            # Runs on normal completion and when the client disconnects mid-stream
+            response = "".join(parts).strip() or FALLBACK_RESPONSE
+            if completed:
+                self._cache_response(cache_key, response)
+            self._store_exchange(session_id, message, response)
+    
     def clear_conversation(self, session_id: str) -> bool:
         """Clear conversation history for a session"""
-        if session_id in self.conversations:
-            del self.conversations[session_id]
+        if self.conversations.clear(session_id):
             logger.info(f"Cleared conversation for session: {session_id}")
             return True
         return False
     
     def get_conversation_history(self, session_id: str) -> List[str]:
         """Get conversation history for a session"""
-        return self.conversations.get(session_id, [])
+        return self.conversations.get_history(session_id)
     
     def get_stats(self) -> Dict[str, Any]:
         """Get service statistics"""
-        total_messages = sum(len(conv) for conv in self.conversations.values())
+        session_stats = self.conversations.stats()
         return {
-            "active_sessions": len(self.conversations),
-            "total_messages": total_messages,
-            "chromadb_documents": len(self.documents) if self.documents else 0
+            "active_sessions": session_stats["active_sessions"],
+            "total_messages": session_stats["total_messages"],
+            "sessions": session_stats,
+            "chromadb_documents": len(self.documents) if self.documents else 0,
+            "response_cache": self.response_cache.stats(),
+            "query_cache": self.retrieval_cache.stats(),
+            "query_vector_cache": self.query_vector_cache.stats(),
+            "query_embedding_cache": self.query_embedding_cache.stats(),
+            "ingestion": self.ingestion_stats,
+            "vector_index": self.vector_index.stats() if self.vector_index is not None else {"backend": "exact"},
+            "single_flight": self.single_flight.stats(),
+            "admission": self.admission.stats(),
+            "summarizer": self.summarizer.stats() if self.summarizer is not None else None
         }
     
+    async def aclose(self):
+        """Release network resources and background threads held by the service"""
+        if self.summarizer is not None:
+            await self.summarizer.stop()
+        self.conversations.close()
+        await self.llm_prober.stop()
+        await self.llm_client.aclose()
+    
+    def _timed_phase(self, name: str, func: Callable[[], Any]):
+        """Run one startup phase and record how long it took"""
+        start_time = time.perf_counter()
+        func()
+        self.startup_timings[name] = round(time.perf_counter() - start_time, 4)
+        logger.info(f"Startup phase '{name}' took {self.startup_timings[name]:.3f}s")
+    
     def initialize_all(self):
         """Initialize all components"""
-        self.initialize_embedding_model()
-        self.initialize_chromadb()
-        self.load_portfolio_data()
\ No newline at end of file
+        start_time = time.perf_counter()
+        try:
+            self._timed_phase("embedding_model", self.initialize_embedding_model)
+            # Only the HNSW vector index queries the Chroma collection (through its own client)
+            if Config.ENABLE_CHROMADB:
+                self._timed_phase("chromadb", self.initialize_chromadb)
+            self._timed_phase("index", self.load_portfolio_data)
+            if Config.VECTOR_INDEX == "hnsw":
+                self._timed_phase("vector_index", self.build_vector_index)
+        except Exception as e:
+            self.status = "failed"
+            self.startup_error = str(e)
+            raise
+        
+        self.startup_timings["total"] = round(time.perf_counter() - start_time, 4)
+        self.status = "ready"
+        self.ready.set()
+        logger.info(f"RAG service ready in {self.startup_timings['total']:.3f}s: {self.startup_timings}")
+    
+    def initialize_index(self):
+        """Build or load the shared index in the pre-fork parent without starting any threads
+        
+        The dense model (onnxruntime/torch thread pools) and the Chroma client must not
+        exist before fork(): with dense embeddings the index is built in a spawned process
+        and only memory-mapped here. initialize_worker() loads them in each worker.
+        """
+        start_time = time.perf_counter()
+        try:
+            self._timed_phase("embedding_model", lambda: self.initialize_embedding_model(dense=False))
+            if Config.EMBEDDING_MODEL != 'tfidf':
+                self._timed_phase("index", self._build_index_in_subprocess)
+            else:
+                self._timed_phase("index", self.load_portfolio_data)
+            if Config.VECTOR_INDEX == "hnsw":
+                self._timed_phase("vector_index", self.build_vector_index)
+        except Exception as e:
+            self.status = "failed"
+            self.startup_error = str(e)
+            raise
+        
+        self.startup_timings["total"] = round(time.perf_counter() - start_time, 4)
+        self.status = "ready"
+        self.ready.set()
+        logger.info(f"Shared index ready in {self.startup_timings['total']:.3f}s: {self.startup_timings}")
+    
+    def _build_index_in_subprocess(self):
+        """Bring the saved index up to date in a spawned process, then memory-map it"""
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            self.ingestion_stats = pool.submit(_build_index).result()
+        if not self.load_vectors():
+            raise RuntimeError("Index built in a subprocess could not be loaded")
+    
+    def initialize_worker(self):
+        """Per-worker setup after fork: the components that start thread pools"""
+        if Config.EMBEDDING_MODEL != 'tfidf' and self.embedding_backend is None:
+            from embeddings import create_embedding_backend
+            self.embedding_backend = create_embedding_backend(Config.EMBEDDING_MODEL)
+        if Config.ENABLE_CHROMADB and self.chroma_client is None:
+            self.initialize_chromadb()
+    
+    def initialize_in_background(self) -> threading.Thread:
+        """Build or load the index on a background thread while the API already serves requests"""
+        def run():
+            try:
+                self.initialize_all()
+            except Exception as e:
+                logger.error(f"Background initialization failed: {e}")
+        
+        thread = threading.Thread(target=run, name="rag-initializer", daemon=True)
+        thread.start()
+        return thread
+
+def _build_index():
+    """RAGService._build_index_in_subprocess in the spawned process: returns the ingestion stats"""
+    service = RAGService()
+    service.initialize_embedding_model()
+    service.load_portfolio_data()
+    return service.ingestion_stats
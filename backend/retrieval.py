@@ -0,0 +1,322 @@
+# retrieval.py - Inverted-index sparse retrieval over the fitted TF-IDF matrix, plus dense/hybrid scoring
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Sequence, Tuple
+import numpy as np
+from scipy import sparse
+from sklearn.preprocessing import normalize
+
+logger = logging.getLogger(__name__)
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Positions of the k largest scores, best first, in O(n) + O(k log k)"""
+    if k <= 0 or scores.size == 0:
+        return np.empty(0, dtype=np.int64)
+    if k < scores.size:
+        candidates = np.argpartition(-scores, k - 1)[:k]
+        # argpartition picks arbitrarily among scores tied with the k-th; keep the lowest positions
+        kth = scores[candidates].min()
+        tied = np.flatnonzero(scores == kth)
+        if tied.size > 1:
+            above = np.flatnonzero(scores > kth)
+            candidates = np.concatenate((above, tied[:k - above.size]))
+    else:
+        candidates = np.arange(scores.size)
+    # Sort the selected few by score, breaking ties by position for stable results
+    order = np.lexsort((candidates, -scores[candidates]))
+    return candidates[order]
+
+class SparseRetrievalEngine:
+    """Cosine-similarity search that only scores documents sharing a term with the query"""
+
+    def __init__(self, document_vectors):
+        # L2-normalized rows make the dot product equal to cosine similarity
+        rows = normalize(sparse.csr_matrix(document_vectors, dtype=np.float32), norm='l2', copy=True)
+
+        # Column-major copy of the rows = one posting list (doc ids + weights) per term
+        postings = rows.tocsc()
+        postings.sort_indices()
+        self._set_postings(sparse.csr_matrix(
+            (postings.data, postings.indices, postings.indptr),
+            shape=(rows.shape[1], rows.shape[0])
+        ))
+
+    @classmethod
+    def from_postings(cls, term_documents) -> "SparseRetrievalEngine":
+        """Wrap an already-normalized term x document CSR matrix without copying it"""
+        engine = cls.__new__(cls)
+        engine._set_postings(term_documents)
+        return engine
+
+    def _set_postings(self, term_documents):
+        """Adopt a term x document CSR matrix whose rows are the posting lists"""
+        # The same postings serve single-query gathers and batched products
+        self.term_documents = term_documents
+        self.n_features, self.n_documents = term_documents.shape
+        self.posting_ptr = term_documents.indptr
+        self.posting_docs = term_documents.indices
+        self.posting_weights = term_documents.data
+        logger.info(f"Built inverted index over {self.n_documents} documents, {term_documents.nnz} postings")
+
+    @staticmethod
+    def _query_terms(query_vector) -> Tuple[np.ndarray, np.ndarray]:
+        """(term ids, weights) of the L2-normalized query"""
+        query = normalize(sparse.csr_matrix(query_vector, dtype=np.float32), norm='l2')
+        return query.indices, query.data
+
+    def score(self, query_vector) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (candidate doc ids, cosine scores) for documents sharing a query term"""
+        terms, weights = self._query_terms(query_vector)
+        if terms.size == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        starts = self.posting_ptr[terms]
+        return self._accumulate(weights, starts, self.posting_ptr[terms + 1] - starts)
+
+    def _accumulate(self, weights: np.ndarray, starts: np.ndarray, lengths: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Per-document sums of weight * posting weight over one posting slice per query term"""
+        total = int(lengths.sum())
+        if total == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        # Gather every posting of every query term in one vectorized pass
+        offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(total)
+        doc_ids = self.posting_docs[offsets]
+        contributions = self.posting_weights[offsets] * np.repeat(weights, lengths)
+
+        candidates, inverse = np.unique(doc_ids, return_inverse=True)
+        scores = np.bincount(inverse, weights=contributions, minlength=candidates.size)
+        return candidates, scores
+
+    def search(self, query_vector, n_results: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Top n_results (doc ids, scores) with similarity > 0, best first"""
+        candidates, scores = self.score(query_vector)
+        positive = scores > 0  # Only include relevant results
+        candidates, scores = candidates[positive], scores[positive]
+
+        best = top_k(scores, n_results)
+        return candidates[best], scores[best]
+
+    def search_batch(self, query_vectors, n_results: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """Top n_results (doc ids, scores) for every query row, scored in one sparse product"""
+        queries = normalize(sparse.csr_matrix(query_vectors, dtype=np.float32), norm='l2')
+        scores = (queries @ self.term_documents).tocsr()
+        scores.data[scores.data <= 0] = 0  # Only include relevant results
+        scores.eliminate_zeros()
+
+        # Per-row argpartition over each row's candidates only
+        results = []
+        for row in range(scores.shape[0]):
+            start, end = scores.indptr[row], scores.indptr[row + 1]
+            candidates, row_scores = scores.indices[start:end], scores.data[start:end]
+            best = top_k(row_scores, n_results)
+            results.append((candidates[best], row_scores[best]))
+        return results
+
+def merge_top_k(parts: Sequence[Tuple[np.ndarray, np.ndarray]], n_results: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Global top n_results from per-shard top-k (doc ids, scores), ties broken by doc id like top_k"""
+    candidates = np.concatenate([part[0] for part in parts])
+    scores = np.concatenate([part[1] for part in parts])
+    best = np.lexsort((candidates, -scores))[:n_results]
+    return candidates[best], scores[best]
+
+class ShardedRetrievalEngine(SparseRetrievalEngine):
+    """SparseRetrievalEngine that scores contiguous document shards in parallel on a thread pool
+
+    Shards are views, not copies: posting lists are sorted by doc id, so each shard reads
+    the slice of every query term's posting list that falls in its document range. Shard
+    bounds balance postings, not documents. Per-shard top-k are merged into the global
+    top-k, so results are identical to the single-threaded engine. Queries touching fewer
+    than min_parallel_postings postings are scored on the calling thread.
+    """
+
+    @classmethod
+    def from_engine(cls, engine: SparseRetrievalEngine, n_shards: int,
+                    min_parallel_postings: int) -> "ShardedRetrievalEngine":
+        """Shard an existing engine's postings (shared, not copied)"""
+        sharded = cls.__new__(cls)
+        sharded.__dict__.update(engine.__dict__)
+        sharded.min_parallel_postings = min_parallel_postings
+
+        # Cut where the cumulative posting count crosses each 1/n_shards of the total
+        doc_postings = np.cumsum(np.bincount(sharded.posting_docs, minlength=sharded.n_documents))
+        targets = doc_postings[-1] * np.arange(1, n_shards) / n_shards if doc_postings.size else []
+        cuts = np.searchsorted(doc_postings, targets, side='right')
+        sharded.shard_bounds = np.unique(np.concatenate(([0], cuts, [sharded.n_documents]))).astype(np.int64)
+        sharded.n_shards = len(sharded.shard_bounds) - 1
+        sharded._executor = None
+        sharded._executor_pid = None
+        logger.info(f"Split {sharded.n_documents} documents into {sharded.n_shards} scoring shards")
+        return sharded
+
+    def _pool(self) -> ThreadPoolExecutor:
+        """Thread pool of this process (created on first use, so forked workers get their own)"""
+        if self._executor_pid != os.getpid():
+            self._executor = ThreadPoolExecutor(max_workers=self.n_shards, thread_name_prefix="shard")
+            self._executor_pid = os.getpid()
+        return self._executor
+
+    def _shard_slices(self, terms: np.ndarray) -> np.ndarray:
+        """Posting offsets where each shard starts, per query term: shape (terms, n_shards + 1)"""
+        slices = np.empty((terms.size, self.n_shards + 1), dtype=np.int64)
+        for row, term in enumerate(terms):
+            start, end = self.posting_ptr[term], self.posting_ptr[term + 1]
+            slices[row] = start + np.searchsorted(self.posting_docs[start:end], self.shard_bounds)
+        return slices
+
+    def _parallel_slices(self, query_vector):
+        """(weights, shard slices) when the query is heavy enough to fan out, else None"""
+        if self.n_shards < 2:
+            return None
+        terms, weights = self._query_terms(query_vector)
+        if terms.size == 0:
+            return None
+        slices = self._shard_slices(terms)
+        if int((slices[:, -1] - slices[:, 0]).sum()) < self.min_parallel_postings:
+            return None
+        return weights, slices
+
+    def _map_shards(self, weights: np.ndarray, slices: np.ndarray, func):
+        """Apply func(candidates, scores) to every shard's accumulated scores on the pool"""
+        def run(shard: int):
+            starts = slices[:, shard]
+            return func(*self._accumulate(weights, starts, slices[:, shard + 1] - starts))
+        return list(self._pool().map(run, range(self.n_shards)))
+
+    def score(self, query_vector) -> Tuple[np.ndarray, np.ndarray]:
+        plan = self._parallel_slices(query_vector)
+        if plan is None:
+            return super().score(query_vector)
+        # Shards cover increasing doc ranges, so the concatenation stays sorted by doc id
+        parts = self._map_shards(*plan, lambda candidates, scores: (candidates, scores))
+        return np.concatenate([part[0] for part in parts]), np.concatenate([part[1] for part in parts])
+
+    def search(self, query_vector, n_results: int) -> Tuple[np.ndarray, np.ndarray]:
+        plan = self._parallel_slices(query_vector)
+        if plan is None:
+            return super().search(query_vector, n_results)
+
+        def shard_top_k(candidates, scores):
+            positive = scores > 0  # Only include relevant results
+            candidates, scores = candidates[positive], scores[positive]
+            best = top_k(scores, n_results)
+            return candidates[best], scores[best]
+        return merge_top_k(self._map_shards(*plan, shard_top_k), n_results)
+
+    def search_batch(self, query_vectors, n_results: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """Batches are split by query rather than by document: each group is one sparse product"""
+        query_vectors = sparse.csr_matrix(query_vectors)
+        n_queries = query_vectors.shape[0]
+        if self.n_shards < 2 or n_queries < 2 * self.n_shards:
+            return super().search_batch(query_vectors, n_results)
+
+        bounds = np.linspace(0, n_queries, self.n_shards + 1).astype(int)
+        groups = self._pool().map(
+            lambda i: super(ShardedRetrievalEngine, self).search_batch(query_vectors[bounds[i]:bounds[i + 1]], n_results),
+            range(self.n_shards)
+        )
+        return [result for group in groups for result in group]
+
+class DenseIndex:
+    """Exact inner-product search over L2-normalized embeddings stored as int8 or float16
+
+    int8 rows use symmetric per-row scales (score = scale * (q_row . query)), which cuts
+    memory 4x against float32 with a cosine error around 1e-3.
+    """
+    BLOCK_ROWS = 65536  # Rows dequantized at a time, bounding temporary float32 memory
+
+    def __init__(self, vectors: np.ndarray, scales: Optional[np.ndarray] = None):
+        self.vectors = vectors
+        self.scales = scales
+        self.n_documents, self.dimension = vectors.shape
+        self.dtype = str(vectors.dtype)
+
+    @classmethod
+    def from_float(cls, embeddings: np.ndarray, dtype: str) -> "DenseIndex":
+        """Quantize float embeddings to dtype ("int8", "float16" or "float32")"""
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        if dtype == "int8":
+            scales = np.abs(embeddings).max(axis=1) / 127.0
+            scales[scales == 0] = 1.0
+            vectors = np.rint(embeddings / scales[:, None]).astype(np.int8)
+            return cls(vectors, scales.astype(np.float32))
+        if dtype in ("float16", "float32"):
+            return cls(embeddings.astype(dtype))
+        raise ValueError(f"Unsupported embedding dtype: {dtype}")
+
+    @classmethod
+    def merge(cls, previous: "DenseIndex", previous_rows: np.ndarray, new: Optional["DenseIndex"]) -> "DenseIndex":
+        """Row previous_rows[i] of previous where it is >= 0, else the next row of new
+
+        Rows are quantized independently, so reused rows are copied without requantizing.
+        """
+        reused = previous_rows >= 0
+        vectors = np.empty((len(previous_rows), previous.dimension), dtype=previous.vectors.dtype)
+        vectors[reused] = previous.vectors[previous_rows[reused]]
+        if new is not None:
+            vectors[~reused] = new.vectors
+        scales = None
+        if previous.scales is not None:
+            scales = np.empty(len(previous_rows), dtype=np.float32)
+            scales[reused] = previous.scales[previous_rows[reused]]
+            if new is not None:
+                scales[~reused] = new.scales
+        return cls(vectors, scales)
+
+    def rows(self, start: int, end: int) -> np.ndarray:
+        """Dequantized float32 embeddings of documents start..end-1"""
+        block = self.vectors[start:end].astype(np.float32)
+        if self.scales is not None:
+            block *= self.scales[start:end, None]
+        return block
+
+    def scores(self, query_embedding: np.ndarray) -> np.ndarray:
+        """Cosine similarity of the (normalized) query to every document"""
+        query = np.asarray(query_embedding, dtype=np.float32).ravel()
+        out = np.empty(self.n_documents, dtype=np.float32)
+        for start in range(0, self.n_documents, self.BLOCK_ROWS):
+            block = self.vectors[start:start + self.BLOCK_ROWS]
+            out[start:start + len(block)] = block.astype(np.float32, copy=False) @ query
+        if self.scales is not None:
+            out *= self.scales
+        return out
+
+    def scores_for(self, doc_ids: np.ndarray, query_embedding: np.ndarray) -> np.ndarray:
+        """scores() restricted to doc_ids"""
+        query = np.asarray(query_embedding, dtype=np.float32).ravel()
+        out = self.vectors[doc_ids].astype(np.float32, copy=False) @ query
+        if self.scales is not None:
+            out *= self.scales[doc_ids]
+        return out
+
+    def search(self, query_embedding: np.ndarray, n_results: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Top n_results (doc ids, scores) with similarity > 0, best first"""
+        scores = self.scores(query_embedding)
+        best = top_k(scores, n_results)
+        best = best[scores[best] > 0]
+        return best, scores[best]
+
+def fuse_candidates(dense_index: DenseIndex, query_embedding: np.ndarray, dense_candidates: np.ndarray,
+                    sparse_candidates: np.ndarray, sparse_scores: np.ndarray, n_results: int,
+                    dense_weight: float) -> Tuple[np.ndarray, np.ndarray]:
+    """hybrid_search over candidate sets only (e.g. ANN neighbours), so the cost does not grow with the corpus
+
+    Every candidate is given its stored dense score, not only the ANN neighbours, so the
+    ranking matches hybrid_search whenever the exact top documents are among the candidates.
+    """
+    ids = np.union1d(dense_candidates, sparse_candidates)
+    fused = dense_index.scores_for(ids, query_embedding) * dense_weight
+    fused[np.searchsorted(ids, sparse_candidates)] += (1.0 - dense_weight) * sparse_scores
+    best = top_k(fused, n_results)
+    best = best[fused[best] > 0]  # Only include relevant results
+    return ids[best], fused[best]
+
+def hybrid_search(dense_scores: np.ndarray, sparse_candidates: np.ndarray, sparse_scores: np.ndarray,
+                  n_results: int, dense_weight: float) -> Tuple[np.ndarray, np.ndarray]:
+    """Top n_results by dense_weight * dense cosine + (1 - dense_weight) * TF-IDF cosine"""
+    fused = dense_scores * dense_weight
+    fused[sparse_candidates] += (1.0 - dense_weight) * sparse_scores
+    best = top_k(fused, n_results)
+    best = best[fused[best] > 0]  # Only include relevant results
+    return best, fused[best]
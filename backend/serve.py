@@ -0,0 +1,178 @@
+# serve.py - Pre-forking production server sharing one read-only index
+#
+# The parent process loads (or builds) the index once, binds the listening
+# socket and forks WORKERS uvicorn processes. Workers inherit the loaded
+# RAGService copy-on-write; the index arrays are memory-mapped, so every worker
+# reads the same page-cached copy. The parent restarts workers that exit
+# (including ones recycled after WORKER_MAX_REQUESTS), rolls all workers on
+# SIGHUP, and shuts down gracefully on SIGTERM/SIGINT.
+import logging
+import os
+import random
+import signal
+import socket
+import sys
+import time
+from typing import Dict
+
+import uvicorn
+
+from models import Config
+
+logger = logging.getLogger("serve")
+
+class PreforkServer:
+    """Minimal pre-fork supervisor around uvicorn workers"""
+
+    def __init__(self, host: str, port: int, workers: int):
+        self.host = host
+        self.port = port
+        self.workers = max(1, workers)
+        self.sock = None
+        self.children: Dict[int, float] = {}  # pid -> start time
+        self.shutting_down = False
+        self.recycle_requested = False
+
+    def bind(self):
+        """Bind the listening socket in the parent so all workers accept on it"""
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind((self.host, self.port))
+        self.sock.listen(2048)
+        self.sock.set_inheritable(True)
+        logger.info(f"Listening on http://{self.host}:{self.port}")
+
+    def load_index(self):
+        """Build or load the index once, before forking (no threads may be running yet)"""
+        from app import rag_service
+        rag_service.initialize_index()
+
+    def check_session_backend(self):
+        """Conversations must be shared by all workers: default to the SQLite store when
+        forking several of them, and refuse the per-process in-memory store"""
+        if self.workers == 1 or Config.SESSION_BACKEND == "sqlite":
+            return
+        if "SESSION_BACKEND" not in os.environ:
+            Config.SESSION_BACKEND = "sqlite"
+            logger.info(f"{self.workers} workers: storing conversations in {Config.SESSION_DB_PATH} (SESSION_BACKEND=sqlite)")
+            return
+        logger.error(
+            f"{self.workers} workers with SESSION_BACKEND={Config.SESSION_BACKEND!r}: conversation "
+            f"history would not be shared between workers. Set SESSION_BACKEND=sqlite, or WEB_CONCURRENCY=1."
+        )
+        sys.exit(1)
+
+    def spawn_worker(self):
+        pid = os.fork()
+        if pid:
+            self.children[pid] = time.monotonic()
+            return
+
+        # Child: restore default signal handling; uvicorn installs its own graceful handlers
+        for sig in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+            signal.signal(sig, signal.SIG_DFL)
+        exit_code = 0
+        try:
+            from app import app, rag_service
+            rag_service.initialize_worker()
+            limit = None
+            if Config.WORKER_MAX_REQUESTS > 0:
+                limit = Config.WORKER_MAX_REQUESTS + random.randint(0, Config.WORKER_MAX_REQUESTS_JITTER)
+            config = uvicorn.Config(
+                app,
+                log_level="info",
+                limit_max_requests=limit,
+                timeout_graceful_shutdown=int(Config.WORKER_GRACEFUL_TIMEOUT)
+            )
+            uvicorn.Server(config).run(sockets=[self.sock])
+        except Exception as e:
+            logger.error(f"Worker {os.getpid()} crashed: {e}")
+            exit_code = 1
+        finally:
+            os._exit(exit_code)
+
+    def reap(self):
+        """Collect exited workers and top the pool back up unless shutting down"""
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+
+            started = self.children.pop(pid, None)
+            if started is None:
+                continue
+            logger.info(f"Worker {pid} exited with status {os.waitstatus_to_exitcode(status)}")
+            if not self.shutting_down and len(self.children) < self.workers:
+                # Back off if workers die right after starting
+                if time.monotonic() - started < 1.0:
+                    time.sleep(1.0)
+                self.spawn_worker()
+
+    def recycle_all(self):
+        """Rolling restart: start a replacement before stopping each old worker"""
+        for pid in list(self.children):
+            self.spawn_worker()
+            self.signal_worker(pid, signal.SIGTERM)
+        logger.info("Recycled all workers")
+
+    def signal_worker(self, pid: int, sig: int):
+        try:
+            os.kill(pid, sig)
+        except ProcessLookupError:
+            self.children.pop(pid, None)
+
+    def stop(self):
+        """Ask workers to finish in-flight requests, then kill stragglers"""
+        logger.info(f"Shutting down {len(self.children)} workers")
+        for pid in list(self.children):
+            self.signal_worker(pid, signal.SIGTERM)
+
+        deadline = time.monotonic() + Config.WORKER_GRACEFUL_TIMEOUT
+        while self.children and time.monotonic() < deadline:
+            self.reap()
+            time.sleep(0.1)
+        for pid in list(self.children):
+            logger.warning(f"Worker {pid} did not exit in time, killing it")
+            self.signal_worker(pid, signal.SIGKILL)
+        self.reap()
+
+    def run(self):
+        if not Config.TOGETHER_API_KEY:
+            logger.error("TOGETHER_API_KEY not found in environment variables")
+            sys.exit(1)
+
+        self.check_session_backend()
+        self.bind()
+        self.load_index()
+
+        def on_shutdown(signum, frame):
+            self.shutting_down = True
+
+        def on_recycle(signum, frame):
+            self.recycle_requested = True
+
+        signal.signal(signal.SIGTERM, on_shutdown)
+        signal.signal(signal.SIGINT, on_shutdown)
+        signal.signal(signal.SIGHUP, on_recycle)
+
+        for _ in range(self.workers):
+            self.spawn_worker()
+        logger.info(f"Started {self.workers} workers")
+
+        while not self.shutting_down:
+            if self.recycle_requested:
+                self.recycle_requested = False
+                self.recycle_all()
+            self.reap()
+            time.sleep(0.5)
+
+        self.stop()
+        self.sock.close()
+        logger.info("Server stopped")
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    PreforkServer(Config.HOST, Config.PORT, Config.WORKERS).run()
@@ -0,0 +1,609 @@
+# session_store.py - Conversation memory backends (in-process or shared SQLite)
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict, deque
+from typing import Any, Dict, List, Optional, Tuple
+from cache import LRUCache
+from models import Config
+
+logger = logging.getLogger(__name__)
+
+class _Session:
+    """One conversation: a fixed-capacity ring buffer of messages plus a running summary"""
+    __slots__ = ("messages", "summary", "last_access", "nbytes")
+
+    def __init__(self, capacity: int):
+        self.messages = deque(maxlen=capacity)
+        self.summary = ""
+        self.last_access = time.monotonic()
+        self.nbytes = 0
+
+class SessionStore(ABC):
+    """Interface for conversation memory: ordered message histories keyed by session id"""
+
+    def __init__(self, max_sessions: int, max_messages: int, idle_ttl: float):
+        self.max_sessions = max_sessions
+        self.max_messages = max_messages
+        self.idle_ttl = idle_ttl
+        self._sweeper: Optional[threading.Thread] = None
+        self._stop_sweeper = threading.Event()
+
+    @abstractmethod
+    def get_history(self, session_id: str) -> List[str]:
+        """Last max_messages messages of a session, oldest first (empty for unknown sessions)"""
+
+    @abstractmethod
+    def get_summary(self, session_id: str) -> str:
+        """Running summary of messages folded out of the history ("" if none)"""
+
+    def get_conversation(self, session_id: str) -> Tuple[str, List[str]]:
+        """(running summary, recent messages) of a session"""
+        return self.get_summary(session_id), self.get_history(session_id)
+
+    @abstractmethod
+    def append(self, session_id: str, *messages: str):
+        """Append messages to a session, creating it if needed"""
+
+    @abstractmethod
+    def compact(self, session_id: str, summary: str, folded: List[str]) -> bool:
+        """Replace the oldest messages with a new running summary
+
+        folded must be the messages the summary was written from; if the start of the
+        history no longer matches them (cleared, evicted, compacted concurrently),
+        nothing changes and False is returned.
+        """
+
+    @abstractmethod
+    def clear(self, session_id: str) -> bool:
+        """Remove a session; returns False if it did not exist"""
+
+    @abstractmethod
+    def sweep(self) -> int:
+        """Expire idle sessions; returns how many were removed"""
+
+    @abstractmethod
+    def stats(self) -> Dict[str, Any]:
+        """Session counters for the stats endpoint"""
+
+    def start_sweeper(self, interval: float):
+        """Run sweep() every interval seconds on a daemon thread"""
+        if self._sweeper is not None and self._sweeper.is_alive():
+            return
+        self._stop_sweeper.clear()
+
+        def run():
+            while not self._stop_sweeper.wait(interval):
+                try:
+                    self.sweep()
+                except Exception as e:
+                    logger.error(f"Session sweep failed: {e}")
+
+        self._sweeper = threading.Thread(target=run, name="session-sweeper", daemon=True)
+        self._sweeper.start()
+
+    def stop_sweeper(self):
+        """Stop the background sweeper thread"""
+        self._stop_sweeper.set()
+        if self._sweeper is not None:
+            self._sweeper.join(timeout=1.0)
+            self._sweeper = None
+
+    def close(self):
+        """Stop background work and release resources"""
+        self.stop_sweeper()
+
+class InMemorySessionStore(SessionStore):
+    """Conversation histories kept in process memory, bounded by session count and idle TTL"""
+
+    def __init__(self, max_sessions: int, max_messages: int, idle_ttl: float):
+        super().__init__(max_sessions, max_messages, idle_ttl)
+        self._sessions: "OrderedDict[str, _Session]" = OrderedDict()  # Least recently used first
+        self._lock = threading.Lock()
+
+        # Kept up to date incrementally so stats never scan every session
+        self.total_messages = 0
+        self.total_bytes = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self._sessions
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def get_history(self, session_id: str) -> List[str]:
+        """Messages of a session, oldest first (empty for unknown sessions)"""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return []
+            session.last_access = time.monotonic()
+            self._sessions.move_to_end(session_id)
+            return list(session.messages)
+
+    def get_summary(self, session_id: str) -> str:
+        """Running summary of a session ("" for unknown or uncompacted sessions)"""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            return session.summary if session is not None else ""
+
+    def get_conversation(self, session_id: str) -> Tuple[str, List[str]]:
+        """(running summary, messages) of a session under a single lock acquisition"""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return "", []
+            session.last_access = time.monotonic()
+            self._sessions.move_to_end(session_id)
+            return session.summary, list(session.messages)
+
+    def append(self, session_id: str, *messages: str):
+        """Append messages to a session, creating it (and evicting the LRU session) if needed"""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = self._sessions[session_id] = _Session(self.max_messages)
+                while len(self._sessions) > self.max_sessions:
+                    self._drop_oldest()
+                    self.evictions += 1
+
+            for message in messages:
+                # A full ring buffer drops its oldest message on append
+                if len(session.messages) == session.messages.maxlen:
+                    dropped = sys.getsizeof(session.messages[0])
+                    session.nbytes -= dropped
+                    self.total_bytes -= dropped
+                    self.total_messages -= 1
+                session.messages.append(message)
+                size = sys.getsizeof(message)
+                session.nbytes += size
+                self.total_bytes += size
+                self.total_messages += 1
+
+            session.last_access = time.monotonic()
+            self._sessions.move_to_end(session_id)
+
+    def compact(self, session_id: str, summary: str, folded: List[str]) -> bool:
+        """Drop the folded messages from the start of the history and store the new summary"""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None or not folded or len(session.messages) < len(folded):
+                return False
+            if any(session.messages[i] != message for i, message in enumerate(folded)):
+                return False
+
+            for _ in folded:
+                size = sys.getsizeof(session.messages.popleft())
+                session.nbytes -= size
+                self.total_bytes -= size
+                self.total_messages -= 1
+            size_delta = sys.getsizeof(summary) - (sys.getsizeof(session.summary) if session.summary else 0)
+            session.nbytes += size_delta
+            self.total_bytes += size_delta
+            session.summary = summary
+            return True
+
+    def clear(self, session_id: str) -> bool:
+        """Remove a session; returns False if it did not exist"""
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+            if session is None:
+                return False
+            self._forget(session)
+            return True
+
+    def _forget(self, session: _Session):
+        self.total_messages -= len(session.messages)
+        self.total_bytes -= session.nbytes
+
+    def _drop_oldest(self):
+        _, session = self._sessions.popitem(last=False)
+        self._forget(session)
+
+    def sweep(self) -> int:
+        """Expire sessions idle for longer than idle_ttl; returns how many were removed"""
+        cutoff = time.monotonic() - self.idle_ttl
+        removed = 0
+        with self._lock:
+            # Sessions are in LRU order, so stop at the first one still in use
+            while self._sessions:
+                oldest = next(iter(self._sessions.values()))
+                if oldest.last_access > cutoff:
+                    break
+                self._drop_oldest()
+                removed += 1
+            self.expirations += removed
+        if removed:
+            logger.info(f"Expired {removed} idle conversation sessions")
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        """Session counters for the stats endpoint"""
+        return {
+            "backend": "memory",
+            "active_sessions": len(self._sessions),
+            "total_messages": self.total_messages,
+            "approx_bytes": self.total_bytes,
+            "evictions": self.evictions,
+            "expirations": self.expirations
+        }
+
+_SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    version INTEGER NOT NULL,
+    last_access REAL NOT NULL,
+    summary TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS idx_sessions_last_access ON sessions(last_access);
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id TEXT NOT NULL,
+    content TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_messages_session ON messages(session_id, id);
+"""
+
+class SQLiteSessionStore(SessionStore):
+    """Conversation histories in a SQLite database (WAL mode) shared by every worker process
+
+    Appends are buffered and written in batches by a background flusher thread, so
+    other workers see a new message after at most flush_interval seconds. Reads go
+    through a small LRU cache that is validated against a per-session version
+    counter, so only one indexed lookup is needed when the history is unchanged.
+    Writes use a second connection under their own lock: waiting for the database
+    write lock (held by another worker, up to the busy timeout) never blocks reads or
+    appends, which only share the store lock with the instant of each COMMIT.
+    Session and message counts are refreshed by the flusher every stats_interval
+    seconds on its own connection, so stats() never queries the database.
+    """
+
+    def __init__(self, path: str, max_sessions: int, max_messages: int, idle_ttl: float,
+                 cache_size: int, flush_interval: float, flush_batch_size: int, stats_interval: float):
+        super().__init__(max_sessions, max_messages, idle_ttl)
+        self.path = path
+        self.flush_interval = flush_interval
+        self.flush_batch_size = flush_batch_size
+        self.stats_interval = stats_interval
+
+        self._lock = threading.RLock()  # Guards the read connection, pending writes and cache
+        self._write_lock = threading.RLock()  # Serializes transactions on the write connection
+        self._pending: Dict[str, List[str]] = {}  # Session id -> messages not yet written
+        self._flushing: Dict[str, List[str]] = {}  # Messages of the write transaction in progress
+        self._pending_count = 0
+        self._cache = LRUCache(cache_size)  # Session id -> (version, messages, summary)
+        self.flushes = 0
+        self.evictions = 0
+        self.expirations = 0
+        # Database-wide counts (all workers), replaced as a whole by the flusher
+        self._db_stats = {"active_sessions": 0, "total_messages": 0, "approx_bytes": 0}
+
+        # The connection and flusher thread are opened on first use in each process,
+        # so the store can be created before the server pre-forks its workers
+        self._conn: Optional[sqlite3.Connection] = None
+        self._write_conn: Optional[sqlite3.Connection] = None
+        self._owner_pid: Optional[int] = None
+        self._wake_flusher = threading.Event()
+        self._stop_flusher = threading.Event()
+        self._flusher: Optional[threading.Thread] = None
+
+    def _ensure_open(self):
+        """Open the database and start the flusher in the current process (call with _lock held)"""
+        if self._conn is not None and self._owner_pid == os.getpid():
+            return
+        # isolation_level=None: transactions are managed explicitly on the write connection
+        self._conn = sqlite3.connect(self.path, timeout=5.0, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SQLITE_SCHEMA)
+        self._migrate_schema()
+        self._write_conn = sqlite3.connect(self.path, timeout=5.0, check_same_thread=False, isolation_level=None)
+        self._write_conn.execute("PRAGMA synchronous=NORMAL")
+        self._owner_pid = os.getpid()
+        self._pending, self._pending_count, self._flushing = {}, 0, {}
+        self._cache.clear()
+
+        self._stop_flusher.clear()
+        self._flusher = threading.Thread(target=self._run_flusher, name="session-flusher", daemon=True)
+        self._flusher.start()
+        logger.info(f"Using SQLite session store at {self.path}")
+
+    def _migrate_schema(self):
+        """Add columns missing from databases created by earlier versions"""
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(sessions)")}
+        if "summary" not in columns:
+            try:
+                self._conn.execute("ALTER TABLE sessions ADD COLUMN summary TEXT NOT NULL DEFAULT ''")
+            except sqlite3.OperationalError:
+                pass  # Another worker added it first
+
+    def _read_version(self, session_id: str) -> int:
+        row = self._write_conn.execute(
+            "SELECT version FROM sessions WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        return row[0] if row else 0
+
+    def _read_messages(self, session_id: str) -> List[str]:
+        rows = self._conn.execute(
+            "SELECT content FROM messages WHERE session_id = ? ORDER BY id DESC LIMIT ?",
+            (session_id, self.max_messages)
+        ).fetchall()
+        return [row[0] for row in reversed(rows)]
+
+    def _cached_entry(self, session_id: str) -> Tuple[int, List[str], str]:
+        """(version, stored messages, summary), re-read only if the version moved (call with _lock held)"""
+        self._ensure_open()
+        row = self._conn.execute(
+            "SELECT version, summary FROM sessions WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        version, summary = row if row else (0, "")
+        entry = self._cache.get(session_id)
+        if entry is None or entry[0] != version:
+            entry = (version, self._read_messages(session_id), summary)
+            self._cache.set(session_id, entry)
+        return entry
+
+    def get_history(self, session_id: str) -> List[str]:
+        """Messages of a session, oldest first, including writes not yet flushed"""
+        return self.get_conversation(session_id)[1]
+
+    def get_summary(self, session_id: str) -> str:
+        """Running summary of a session ("" for unknown or uncompacted sessions)"""
+        with self._lock:
+            return self._cached_entry(session_id)[2]
+
+    def get_conversation(self, session_id: str) -> Tuple[str, List[str]]:
+        """(running summary, messages) of a session with a single version check"""
+        with self._lock:
+            _, messages, summary = self._cached_entry(session_id)
+            history = messages + self._flushing.get(session_id, []) + self._pending.get(session_id, [])
+            return summary, history[-self.max_messages:]
+
+    def append(self, session_id: str, *messages: str):
+        """Queue messages for the next batched write"""
+        with self._lock:
+            self._ensure_open()
+            self._pending.setdefault(session_id, []).extend(messages)
+            self._pending_count += len(messages)
+            if self._pending_count >= self.flush_batch_size:
+                self._wake_flusher.set()
+
+    def _commit(self):
+        """Commit the write transaction; with the store lock held, readers see either the
+        old rows plus the in-flight messages or the new rows, never both"""
+        with self._lock:
+            self._write_conn.execute("COMMIT")
+            self._flushing = {}
+
+    def _rollback(self):
+        if self._write_conn.in_transaction:
+            self._write_conn.execute("ROLLBACK")
+
+    def flush(self):
+        """Write every pending message in one transaction"""
+        with self._write_lock:
+            with self._lock:
+                if not self._pending:
+                    return
+                pending, self._pending, self._pending_count = self._pending, {}, 0
+                self._flushing = pending
+            now = time.time()
+
+            # Waits out other workers' write transactions without holding the store lock
+            self._write_conn.execute("BEGIN IMMEDIATE")
+            try:
+                versions: Dict[str, Tuple[int, int]] = {}
+                for session_id, messages in pending.items():
+                    old_version = self._read_version(session_id)
+                    self._write_conn.executemany(
+                        "INSERT INTO messages (session_id, content) VALUES (?, ?)",
+                        [(session_id, message) for message in messages]
+                    )
+                    self._write_conn.execute(
+                        "INSERT INTO sessions (session_id, version, last_access) VALUES (?, ?, ?) "
+                        "ON CONFLICT(session_id) DO UPDATE SET version = excluded.version, "
+                        "last_access = excluded.last_access",
+                        (session_id, old_version + 1, now)
+                    )
+                    # Keep only the last max_messages messages per session
+                    self._write_conn.execute(
+                        "DELETE FROM messages WHERE session_id = ? AND id NOT IN "
+                        "(SELECT id FROM messages WHERE session_id = ? ORDER BY id DESC LIMIT ?)",
+                        (session_id, session_id, self.max_messages)
+                    )
+                    versions[session_id] = (old_version, old_version + 1)
+                self._commit()
+            except Exception:
+                self._rollback()
+                # Put the batch back so it is retried on the next flush
+                with self._lock:
+                    self._flushing = {}
+                    for session_id, messages in pending.items():
+                        self._pending[session_id] = messages + self._pending.get(session_id, [])
+                        self._pending_count += len(messages)
+                raise
+
+            # Roll cached histories forward if nobody else wrote to the session meanwhile
+            with self._lock:
+                for session_id, (old_version, new_version) in versions.items():
+                    entry = self._cache.pop(session_id)
+                    if entry is not None and entry[0] == old_version:
+                        messages = (entry[1] + pending[session_id])[-self.max_messages:]
+                        self._cache.set(session_id, (new_version, messages, entry[2]))
+            self.flushes += 1
+
+    def _refresh_stats(self, conn: sqlite3.Connection):
+        """Count sessions and messages on the flusher's own connection, without the store lock"""
+        sessions = conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+        messages = conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+        page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+        page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+        self._db_stats = {
+            "active_sessions": sessions,
+            "total_messages": messages,
+            "approx_bytes": page_count * page_size
+        }
+
+    def _run_flusher(self):
+        stats_conn = sqlite3.connect(self.path, timeout=5.0)
+        next_refresh = 0.0
+        try:
+            while not self._stop_flusher.is_set():
+                self._wake_flusher.wait(self.flush_interval)
+                self._wake_flusher.clear()
+                try:
+                    self.flush()
+                except Exception as e:
+                    logger.error(f"Failed to flush session writes: {e}")
+                if time.monotonic() >= next_refresh:
+                    next_refresh = time.monotonic() + self.stats_interval
+                    try:
+                        self._refresh_stats(stats_conn)
+                    except Exception as e:
+                        logger.error(f"Failed to refresh session stats: {e}")
+        finally:
+            stats_conn.close()
+
+    def compact(self, session_id: str, summary: str, folded: List[str]) -> bool:
+        """Delete the folded messages and store the new summary in one transaction"""
+        if not folded:
+            return False
+        with self._write_lock:
+            with self._lock:
+                self._ensure_open()
+            self.flush()  # The folded messages may still be pending
+            self._write_conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._write_conn.execute(
+                    "SELECT id, content FROM messages WHERE session_id = ? ORDER BY id LIMIT ?",
+                    (session_id, len(folded))
+                ).fetchall()
+                if [row[1] for row in rows] != list(folded):
+                    self._write_conn.execute("ROLLBACK")
+                    return False
+                self._write_conn.execute(
+                    "DELETE FROM messages WHERE session_id = ? AND id <= ?", (session_id, rows[-1][0])
+                )
+                self._write_conn.execute(
+                    "UPDATE sessions SET summary = ?, version = version + 1 WHERE session_id = ?",
+                    (summary, session_id)
+                )
+                self._commit()
+            except Exception:
+                self._rollback()
+                raise
+            with self._lock:
+                self._cache.pop(session_id)
+            return True
+
+    def clear(self, session_id: str) -> bool:
+        """Remove a session and its messages"""
+        with self._write_lock:
+            with self._lock:
+                self._ensure_open()
+                pending = self._pending.pop(session_id, None)
+                if pending is not None:
+                    self._pending_count -= len(pending)
+            self._write_conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._write_conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+                deleted = self._write_conn.execute(
+                    "DELETE FROM sessions WHERE session_id = ?", (session_id,)
+                ).rowcount
+                self._commit()
+            except Exception:
+                self._rollback()
+                raise
+            with self._lock:
+                self._cache.pop(session_id)
+            return pending is not None or deleted > 0
+
+    def _delete_sessions(self, where: str, params: tuple) -> int:
+        """Delete the sessions selected by a subquery over the sessions table (call with _write_lock held)"""
+        self._write_conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._write_conn.execute(
+                f"DELETE FROM messages WHERE session_id IN (SELECT session_id FROM sessions {where})", params
+            )
+            removed = self._write_conn.execute(
+                f"DELETE FROM sessions WHERE session_id IN (SELECT session_id FROM sessions {where})", params
+            ).rowcount
+            self._commit()
+        except Exception:
+            self._rollback()
+            raise
+        return removed
+
+    def sweep(self) -> int:
+        """Expire idle sessions and evict the least recently used ones beyond max_sessions"""
+        with self._write_lock:
+            with self._lock:
+                self._ensure_open()
+            expired = self._delete_sessions("WHERE last_access < ?", (time.time() - self.idle_ttl,))
+            overflow = self._write_conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0] - self.max_sessions
+            evicted = self._delete_sessions("ORDER BY last_access LIMIT ?", (overflow,)) if overflow > 0 else 0
+            if expired or evicted:
+                with self._lock:
+                    self._cache.clear()
+            self.expirations += expired
+            self.evictions += evicted
+        if expired or evicted:
+            logger.info(f"Expired {expired} idle and evicted {evicted} conversation sessions")
+        return expired + evicted
+
+    def stats(self) -> Dict[str, Any]:
+        """Session counters for the stats endpoint (counts are at most stats_interval seconds old)"""
+        with self._lock:
+            self._ensure_open()
+        db_stats = self._db_stats
+        return {
+            "backend": "sqlite",
+            "active_sessions": db_stats["active_sessions"],
+            "total_messages": db_stats["total_messages"] + self._pending_count,
+            "approx_bytes": db_stats["approx_bytes"],
+            "pending_writes": self._pending_count,
+            "flushes": self.flushes,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "cache": self._cache.stats()
+        }
+
+    def close(self):
+        """Flush pending writes and close the database"""
+        super().close()
+        if self._conn is None or self._owner_pid != os.getpid():
+            return
+        self._stop_flusher.set()
+        self._wake_flusher.set()
+        self._flusher.join(timeout=1.0)
+        with self._write_lock:
+            self.flush()
+            with self._lock:
+                self._conn.close()
+                self._write_conn.close()
+                self._conn = self._write_conn = None
+
+def create_session_store() -> SessionStore:
+    """Build the session store selected by Config.SESSION_BACKEND"""
+    if Config.SESSION_BACKEND == "sqlite":
+        return SQLiteSessionStore(
+            Config.SESSION_DB_PATH,
+            max_sessions=Config.MAX_SESSIONS,
+            max_messages=Config.MAX_CONVERSATION_HISTORY,
+            idle_ttl=Config.SESSION_IDLE_TTL,
+            cache_size=Config.SESSION_CACHE_SIZE,
+            flush_interval=Config.SESSION_FLUSH_INTERVAL,
+            flush_batch_size=Config.SESSION_FLUSH_BATCH_SIZE,
+            stats_interval=Config.SESSION_STATS_INTERVAL
+        )
+    return InMemorySessionStore(
+        max_sessions=Config.MAX_SESSIONS,
+        max_messages=Config.MAX_CONVERSATION_HISTORY,
+        idle_ttl=Config.SESSION_IDLE_TTL
+    )
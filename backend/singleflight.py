@@ -0,0 +1,73 @@
+# singleflight.py - Coalesce identical in-flight calls into one execution
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+class _Call:
+    """A sync call in progress; followers wait on the event"""
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight:
+    """While a call for a key is running, later callers with the same key share its result"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self._tasks: Dict[Hashable, asyncio.Task] = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    def do(self, key: Hashable, func: Callable[[], Any]) -> Any:
+        """Run func for key, or wait for the identical call already running on another thread"""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self.coalesced += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                self.leaders += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    async def do_async(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+        """Await func() for key, or join the identical call already in flight"""
+        task = self._tasks.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            # A separate task, so one caller disconnecting does not cancel the shared call
+            task = asyncio.ensure_future(func())
+            self._tasks[key] = task
+            self.leaders += 1
+            task.add_done_callback(lambda _: self._tasks.pop(key, None))
+        return await asyncio.shield(task)
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters for the stats endpoint"""
+        return {
+            "in_flight": len(self._calls) + len(self._tasks),
+            "leaders": self.leaders,
+            "coalesced": self.coalesced
+        }
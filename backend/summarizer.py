@@ -0,0 +1,126 @@
+# summarizer.py - Background compaction of long conversations into running summaries
+import asyncio
+import logging
+import threading
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from admission import Overloaded
+from session_store import SessionStore
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_PROMPT = """Summarize the conversation below between a visitor and Taofik Akanbi, a Data Scientist chatting on his portfolio website.
+Update the earlier summary with the new messages in at most 3 short sentences, written in the third person.
+Keep what the visitor asked about, what was already answered, and any names or details they shared.
+
+Earlier summary:
+{summary}
+
+New messages:
+{messages}
+
+Updated summary:"""
+
+class ConversationSummarizer:
+    """Folds older turns of long sessions into a running summary, off the request path
+
+    Chat handlers only call schedule(); a background task wakes every interval seconds,
+    takes up to batch_size scheduled sessions and summarizes those that have reached
+    trigger_messages, keeping the last keep_recent messages verbatim.
+    """
+
+    def __init__(self, store: SessionStore, complete: Callable[[str], Awaitable[str]],
+                 trigger_messages: int, keep_recent: int, interval: float, batch_size: int):
+        self.store = store
+        self.complete = complete  # async prompt -> summary text
+        self.trigger_messages = trigger_messages
+        self.keep_recent = keep_recent
+        self.interval = interval
+        self.batch_size = batch_size
+        self._lock = threading.Lock()  # schedule() may be called from worker threads
+        self._pending: Dict[str, None] = {}  # Insertion-ordered set of session ids
+        self._task: Optional[asyncio.Task] = None
+        self.compactions = 0
+        self.failures = 0
+        self.deferred = 0
+
+    def schedule(self, session_id: str):
+        """Mark a session to be checked on the next pass (O(1), safe from any thread)"""
+        with self._lock:
+            self._pending[session_id] = None
+
+    def _take_batch(self) -> List[str]:
+        with self._lock:
+            batch = list(self._pending)[:self.batch_size]
+            for session_id in batch:
+                del self._pending[session_id]
+        return batch
+
+    async def compact_session(self, session_id: str) -> bool:
+        """Summarize the older messages of one session if it is over the threshold"""
+        # Store calls may hit SQLite: run them off the event loop
+        summary, history = await asyncio.to_thread(self.store.get_conversation, session_id)
+        if len(history) < self.trigger_messages:
+            return False
+
+        folded = history[:len(history) - self.keep_recent]
+        prompt = SUMMARY_PROMPT.format(summary=summary or "(none)", messages="\n".join(folded))
+        new_summary = await self.complete(prompt)
+        if not await asyncio.to_thread(self.store.compact, session_id, new_summary, folded):
+            return False  # The session changed underneath; it is rescheduled by its next turn
+        self.compactions += 1
+        return True
+
+    async def run_once(self) -> int:
+        """Process one batch concurrently; returns how many sessions were compacted"""
+        batch = self._take_batch()
+        if not batch:
+            return 0
+
+        results = await asyncio.gather(*(self.compact_session(s) for s in batch), return_exceptions=True)
+        compacted = 0
+        for session_id, result in zip(batch, results):
+            if isinstance(result, Overloaded):
+                # Chat traffic has priority; try again on a later pass
+                self.deferred += 1
+                self.schedule(session_id)
+            elif isinstance(result, BaseException):
+                self.failures += 1
+                logger.warning(f"Failed to summarize session {session_id}: {result}")
+            elif result:
+                compacted += 1
+        if compacted:
+            logger.info(f"Compacted {compacted} conversation(s) into running summaries")
+        return compacted
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.error(f"Summarization pass failed: {e}")
+
+    def start(self):
+        """Start the background task on the running event loop"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        """Cancel the background task (pending sessions are simply not compacted)"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters for the stats endpoint"""
+        return {
+            "pending": len(self._pending),
+            "compactions": self.compactions,
+            "failures": self.failures,
+            "deferred": self.deferred
+        }
@@ -0,0 +1,174 @@
+# vector_index.py - Approximate nearest-neighbour search over chunk embeddings in the Chroma collection
+import logging
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Sequence, Tuple
+import numpy as np
+from retrieval import DenseIndex
+
+logger = logging.getLogger(__name__)
+
+def hnsw_configuration(ef_construction: int, max_neighbors: int, ef_search: int) -> Dict[str, Any]:
+    """Chroma collection configuration for cosine HNSW over normalized embeddings"""
+    return {
+        "hnsw": {
+            "space": "cosine",
+            "ef_construction": ef_construction,
+            "max_neighbors": max_neighbors,
+            "ef_search": ef_search
+        }
+    }
+
+def recall_at_k(approximate: Sequence[np.ndarray], exact: Sequence[np.ndarray]) -> float:
+    """Mean fraction of the exact top-k ids that the approximate search also returned"""
+    hits, total = 0, 0
+    for approx_ids, exact_ids in zip(approximate, exact):
+        hits += len(np.intersect1d(approx_ids, exact_ids))
+        total += len(exact_ids)
+    return hits / total if total else 1.0
+
+class ChromaVectorIndex:
+    """HNSW index of the dense embeddings, stored in the persistent Chroma collection
+
+    Embeddings are written in batches at ingestion; a query visits O(ef_search * log n)
+    nodes instead of every row. The collection records a fingerprint of the index it was
+    built from, so it is only rebuilt when the documents or the embedding model change.
+
+    Chroma's runtime does not survive fork(), so the prefork parent never opens a client:
+    sync() builds the collection in a spawned process and workers connect on first query.
+    """
+
+    def __init__(self, path: str, name: str, configuration: Dict[str, Any], batch_size: int):
+        self.path = path
+        self.name = name
+        self.configuration = configuration
+        self.batch_size = batch_size
+        self._client = None
+        self._collection = None
+        self.n_documents = 0
+        self.queries = 0
+
+    def _open(self):
+        """Client and collection, opened on first use"""
+        if self._collection is None:
+            import chromadb
+            self._client = chromadb.PersistentClient(path=self.path)
+            self._collection = self._client.get_or_create_collection(
+                self.name,
+                configuration=self.configuration,
+                embedding_function=None
+            )
+        return self._collection
+
+    def is_current(self, fingerprint: str, n_documents: int) -> bool:
+        """Whether the collection already holds this exact index"""
+        collection = self._open()
+        self.n_documents = collection.count()
+        return (collection.metadata or {}).get("index_fingerprint") == fingerprint \
+            and self.n_documents == n_documents
+
+    def rebuild(self, dense_index: DenseIndex, metadata: Sequence[Dict[str, Any]], fingerprint: str):
+        """Replace the collection with every embedding of dense_index, batch_size rows per write"""
+        start_time = time.perf_counter()
+        self._open()
+        try:
+            self._client.delete_collection(self.name)
+        except Exception:
+            pass  # Nothing to replace yet
+        self._collection = self._client.create_collection(
+            self.name,
+            configuration=self.configuration,
+            metadata={"description": "Taofik Akanbi Portfolio Knowledge Base", "index_fingerprint": fingerprint},
+            embedding_function=None
+        )
+
+        # Chroma caps the rows per call; the int8 rows are dequantized one batch at a time
+        batch_size = min(self.batch_size, self._client.get_max_batch_size())
+        for start in range(0, dense_index.n_documents, batch_size):
+            end = min(start + batch_size, dense_index.n_documents)
+            self._collection.add(
+                ids=[str(row) for row in range(start, end)],
+                embeddings=dense_index.rows(start, end),
+                metadatas=[
+                    {"section_title": metadata[row]['section_title'], "chunk_id": metadata[row]['id']}
+                    for row in range(start, end)
+                ]
+            )
+        self.n_documents = dense_index.n_documents
+        logger.info(
+            f"Indexed {dense_index.n_documents} embeddings in Chroma collection {self.name} "
+            f"in {time.perf_counter() - start_time:.3f}s"
+        )
+
+    def sync(self, index_dir: str, fingerprint: str):
+        """Make the collection match the saved index in index_dir, from a separate process"""
+        start_time = time.perf_counter()
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            self.n_documents, rebuilt = pool.submit(
+                _sync_collection, self.path, self.name, self.configuration, self.batch_size, index_dir, fingerprint
+            ).result()
+        if rebuilt:
+            logger.info(
+                f"Indexed {self.n_documents} embeddings in Chroma collection {self.name} "
+                f"in {time.perf_counter() - start_time:.3f}s"
+            )
+        else:
+            logger.info(f"Using existing HNSW index in Chroma collection {self.name}")
+
+    def set_ef_search(self, ef_search: int):
+        """Trade query latency for recall without rebuilding the graph"""
+        from chromadb.api.client import SharedSystemClient
+        self._open().modify(configuration={"hnsw": {"ef_search": ef_search}})
+        self.configuration["hnsw"]["ef_search"] = ef_search
+        # A loaded HNSW segment keeps its ef until the client is reopened
+        SharedSystemClient.clear_system_cache()
+        self._client = None
+        self._collection = None
+
+    def search(self, query_embedding: np.ndarray, n_results: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Approximate top n_results (doc ids, cosine similarities), best first"""
+        return self.search_batch([query_embedding], n_results)[0]
+
+    def search_batch(self, query_embeddings: Sequence[np.ndarray], n_results: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """search for several queries in one Chroma call"""
+        collection = self._open()
+        n_results = min(n_results, self.n_documents)
+        if n_results <= 0:
+            return [(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)) for _ in query_embeddings]
+
+        result = collection.query(
+            query_embeddings=[np.asarray(q, dtype=np.float32) for q in query_embeddings],
+            n_results=n_results,
+            include=["distances"]
+        )
+        self.queries += len(query_embeddings)
+        # Cosine distance is 1 - similarity
+        return [
+            (np.asarray(ids, dtype=np.int64), 1.0 - np.asarray(distances, dtype=np.float32))
+            for ids, distances in zip(result["ids"], result["distances"])
+        ]
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters for the stats endpoint"""
+        return {
+            "backend": "chroma-hnsw",
+            "collection": self.name,
+            "documents": self.n_documents,
+            "ef_search": self.configuration["hnsw"]["ef_search"],
+            "queries": self.queries
+        }
+
+def _sync_collection(path: str, name: str, configuration: Dict[str, Any], batch_size: int,
+                     index_dir: str, fingerprint: str) -> Tuple[int, bool]:
+    """ChromaVectorIndex.sync in the spawned process: rebuild from the mapped index if stale"""
+    from index_store import load_index
+    index = load_index(index_dir)
+    vector_index = ChromaVectorIndex(path, name, configuration, batch_size)
+    if vector_index.is_current(fingerprint, index['dense'].n_documents):
+        # HNSW_EF_SEARCH may have changed since the collection was built
+        vector_index.set_ef_search(configuration["hnsw"]["ef_search"])
+        return vector_index.n_documents, False
+    vector_index.rebuild(index['dense'], index['metadata'], fingerprint)
+    return vector_index.n_documents, True
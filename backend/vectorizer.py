@@ -0,0 +1,80 @@
+# vectorizer.py - Vocabulary-free TF-IDF over hashed n-gram features
+from typing import Any, Dict, Iterable, Optional, Tuple
+import numpy as np
+from scipy import sparse
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.preprocessing import normalize
+
+class HashingTfidfVectorizer:
+    """Drop-in for a fitted TfidfVectorizer whose features are hashed instead of looked up
+
+    Tokenization is stateless, so partitions of a corpus can be counted in separate
+    processes; only document frequencies are merged to fit the IDF. Weighting follows
+    TfidfVectorizer (raw counts x smooth IDF, L2-normalized rows, min_df/max_df pruning),
+    with a fixed n_features instead of a vocabulary (no max_features cap).
+    """
+
+    def __init__(self, n_features: int = 2 ** 20, stop_words: Optional[str] = 'english',
+                 ngram_range: Tuple[int, int] = (1, 2), lowercase: bool = True,
+                 strip_accents: Optional[str] = 'ascii', min_df: float = 1, max_df: float = 1.0):
+        self.n_features = n_features
+        self.stop_words = stop_words
+        self.ngram_range = tuple(ngram_range)
+        self.lowercase = lowercase
+        self.strip_accents = strip_accents
+        self.min_df = min_df
+        self.max_df = max_df
+        self.idf_: Optional[np.ndarray] = None
+        self._hasher = HashingVectorizer(
+            n_features=n_features,
+            stop_words=stop_words,
+            ngram_range=self.ngram_range,
+            lowercase=lowercase,
+            strip_accents=strip_accents,
+            alternate_sign=False,
+            norm=None,
+            dtype=np.float32
+        )
+
+    def get_params(self) -> Dict[str, Any]:
+        return {
+            'n_features': self.n_features,
+            'stop_words': self.stop_words,
+            'ngram_range': self.ngram_range,
+            'lowercase': self.lowercase,
+            'strip_accents': self.strip_accents,
+            'min_df': self.min_df,
+            'max_df': self.max_df
+        }
+
+    def count(self, texts: Iterable[str]) -> sparse.csr_matrix:
+        """Raw term counts per text (stateless, safe to run in any process)"""
+        return self._hasher.transform(texts)
+
+    @staticmethod
+    def document_frequencies(counts: sparse.csr_matrix) -> Tuple[np.ndarray, np.ndarray]:
+        """(feature ids, number of rows containing them) of a count matrix, in sparse form"""
+        return np.unique(counts.indices, return_counts=True)
+
+    def fit_idf(self, df: np.ndarray, n_documents: int):
+        """Set the IDF from per-feature document frequencies; pruned features get weight 0"""
+        min_count = self.min_df if isinstance(self.min_df, int) else self.min_df * n_documents
+        max_count = self.max_df if isinstance(self.max_df, int) else self.max_df * n_documents
+        idf = np.log((1 + n_documents) / (1 + df)) + 1
+        idf[(df < min_count) | (df > max_count)] = 0
+        self.idf_ = idf.astype(np.float32)
+
+    def weight(self, counts: sparse.csr_matrix) -> sparse.csr_matrix:
+        """Apply the fitted IDF to a count matrix and L2-normalize its rows, in place"""
+        counts.data *= self.idf_[counts.indices]
+        counts.eliminate_zeros()
+        return normalize(counts, norm='l2', copy=False)
+
+    def transform(self, texts: Iterable[str]) -> sparse.csr_matrix:
+        return self.weight(self.count(texts))
+
+    def fit_transform(self, texts: Iterable[str]) -> sparse.csr_matrix:
+        """Single-process fit; ingestion uses count/document_frequencies/fit_idf/weight across partitions"""
+        counts = self.count(texts)
+        self.fit_idf(np.bincount(counts.indices, minlength=self.n_features), counts.shape[0])
+        return self.weight(counts)
@@ -76,6 +76,59 @@ const AdvancedChatInterface = () => {
     }
   };
 
+  // Parse one Server-Sent Event block into { event, data }
+  const parseSSEEvent = (rawEvent) => {
+    let event = 'message';
+    let data = '';
+    rawEvent.split('\n').forEach((line) => {
+      if (line.startsWith('event:')) {
+        event = line.slice(6).trim();
+      } else if (line.startsWith('data:')) {
+        data += line.slice(5).trim();
+      }
+    });
+    return { event, data: data ? JSON.parse(data) : {} };
+  };
+
+  // Stream a reply from the RAG backend, calling onToken with the text so far
+  const streamMessageFromBackend = async (message, onToken) => {
+    const response = await fetch(`${BACKEND_URL}/chat/stream`, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+      },
+      body: JSON.stringify({ message: message }),
+    });
+
+    if (!response.ok || !response.body) {
+      throw new Error(`HTTP error! status: ${response.status}`);
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let fullText = '';
+
+    while (true) {
+      const { done, value } = await reader.read();
+      if (done) break;
+
+      buffer += decoder.decode(value, { stream: true });
+      const rawEvents = buffer.split('\n\n');
+      buffer = rawEvents.pop();
+
+      for (const rawEvent of rawEvents) {
+        const { event, data } = parseSSEEvent(rawEvent);
+        if (event === 'token') {
+          fullText += data.text;
+          onToken(fullText);
+        }
+      }
+    }
+
+    return fullText;
+  };
+
   // Handle window resize
   useEffect(() => {
     const handleResize = () => {
@@ -148,21 +201,39 @@ const AdvancedChatInterface = () => {
     
     setIsTyping(true);
     
-    // Call the backend
-    const response = await sendMessageToBackend(currentMessage);
+    const botMessageId = Date.now() + 1;
+    let botMessageAdded = false;
     
-    setTimeout(() => {
-      const botResponse = {
-        id: Date.now() + 1,
-        text: response.text,
-        sender: 'bot',
-        timestamp: new Date(),
-        read: isOpen
-      };
-      
-      setMessages(prev => [...prev, botResponse]);
-      setIsTyping(false);
-    }, 500);
+    // Show tokens as they arrive instead of waiting for the full reply
+    const showBotText = (text) => {
+      if (!botMessageAdded) {
+        botMessageAdded = true;
+        setIsTyping(false);
+        setMessages(prev => [...prev, {
+          id: botMessageId,
+          text: text,
+          sender: 'bot',
+          timestamp: new Date(),
+          read: isOpen
+        }]);
+      } else {
+        setMessages(prev => 
+          prev.map(msg => msg.id === botMessageId ? {...msg, text: text} : msg)
+        );
+      }
+    };
+    
+    try {
+      await streamMessageFromBackend(currentMessage, showBotText);
+    } catch (error) {
+      console.error('Streaming failed, falling back to /chat:', error);
+      if (!botMessageAdded) {
+        const response = await sendMessageToBackend(currentMessage);
+        showBotText(response.text);
+      }
+    }
+    
+    setIsTyping(false);
   };
 
   const formatTime = (date) => {